@@ -0,0 +1,60 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+'''
+from __future__ import print_function
+
+import argparse
+import sys
+
+from . import runner
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m chai')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser(
+        'run', description='Run test classes on a pool of processes.')
+    run.add_argument(
+        'names', nargs='*', default=['.'], metavar='NAME',
+        help='directories, files or dotted names of tests, default .')
+    run.add_argument(
+        '-j', '--processes', type=int, default=None,
+        help='number of worker processes, default one per CPU')
+    run.add_argument(
+        '-p', '--pattern', default='*test*.py',
+        help="pattern of test files in directories, default '*test*.py'")
+    run.add_argument(
+        '-t', '--top-level-directory', default=None, dest='top_level_dir',
+        help='top level directory of the project, default the directory')
+    run.add_argument(
+        '-v', '--verbose', action='store_true',
+        help='print each class as it finishes')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    units = runner.discover(args.names, args.pattern, args.top_level_dir)
+
+    def progress(result):
+        if args.verbose:
+            status = 'ok'
+            if result.failures or result.errors:
+                status = 'FAILED'
+            elif result.leaks:
+                status = 'LEAKED'
+            print('%s (%d tests, %.3fs) ... %s' % (
+                result.name, result.tests, result.seconds, status),
+                file=sys.stderr)
+
+    report = runner.run(units, args.processes, progress)
+    report.write(sys.stderr)
+    return 0 if report.successful() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Support for stubbing coroutine functions. This needs Python 3.5 syntax, so
+it's only imported when it can be.
+'''
+import asyncio
+import inspect
+from timeit import default_timer
+
+try:
+    from asyncio import get_running_loop as _get_running_loop
+except ImportError:
+    # Before Python 3.7 get_event_loop() returns the running loop, if any
+    _get_running_loop = asyncio.get_event_loop
+
+
+async def respond(exp, args, kwargs):
+    '''
+    Produce the result of a call to an async stub once it's awaited. The
+    call has already been matched and counted. Awaitables returned by side
+    effects, including those of spies, are awaited.
+    '''
+    side_effect_return = exp._run_side_effect(args, kwargs)
+    if inspect.isawaitable(side_effect_return):
+        side_effect_return = await side_effect_return
+    if exp._delay is not None:
+        await asyncio.sleep(exp._delay)
+    return exp._result(side_effect_return)
+
+
+def resolve_later(exp, side_effect_return):
+    '''
+    Return a future for the result of a call to a stub which isn't async,
+    resolved after the expectation's delay on the running event loop.
+    '''
+    try:
+        loop = _get_running_loop()
+    except RuntimeError:
+        # Called outside of the loop, such as before run_until_complete,
+        # so the future belongs to the loop set for this thread.
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+    future = loop.create_future()
+
+    def resolve():
+        if future.cancelled():
+            return
+        try:
+            future.set_result(exp._result(side_effect_return))
+        except BaseException as e:
+            future.set_exception(e)
+    loop.call_later(exp._delay, resolve)
+    return future
+
+
+async def call_spy(spy, args, kwargs):
+    '''
+    Await the original coroutine function for a spy, recording how long it
+    took.
+    '''
+    side_effect_return = spy._run_spy_side_effect(args, kwargs)
+    if inspect.isawaitable(side_effect_return):
+        await side_effect_return
+
+    start = default_timer()
+    try:
+        return_value = await spy._stub.call_orig(*args, **kwargs)
+    finally:
+        spy._record_latency(default_timer() - start)
+
+    if spy._spy_return:
+        spy._spy_return(return_value)
+    return return_value
@@ -0,0 +1,102 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Micro-benchmarks for the hot paths in chai. Run them with
+
+    python -m chai.benchmarks
+
+Each benchmark module exposes a run(scale) function which returns a dict of
+benchmark name to the best time, in seconds, of a single operation.
+'''
+import fnmatch
+import sys
+import timeit
+
+from .. import __version__
+
+# Benchmark modules, in the order they're run and reported.
+MODULES = ('stubs', 'expectations', 'mocks', 'collection', 'versus',
+           'threads')
+
+
+def measure(func, number=1000, repeat=5):
+    '''
+    Return the best time, in seconds, of a single call to func.
+    '''
+    number = max(1, int(number))
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def measure_each(setup, func, number=1000, repeat=5):
+    '''
+    Like measure, but calls setup before each call to func and passes its
+    result in. Only the time spent in func is counted.
+    '''
+    number = max(1, int(number))
+    timer = timeit.default_timer
+    best = None
+    for _ in range(repeat):
+        total = 0.0
+        for _ in range(number):
+            arg = setup()
+            start = timer()
+            func(arg)
+            total += timer() - start
+        if best is None or total < best:
+            best = total
+    return best / number
+
+
+def run(names=None, scale=1.0):
+    '''
+    Run the benchmark modules, optionally only those whose results match
+    one of the glob patterns in names, and return the results document.
+    '''
+    results = {}
+    for module_name in MODULES:
+        # Benchmark names start with their module name
+        if names and not any(fnmatch.fnmatch(module_name, n.split('.')[0])
+                             for n in names):
+            continue
+        module = __import__('chai.benchmarks.' + module_name,
+                            fromlist=['run'])
+        for name, value in module.run(scale=scale).items():
+            if not names or any(fnmatch.fnmatch(name, n) for n in names):
+                results[name] = value
+
+    return {
+        'chai': __version__,
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+
+
+def threshold_for(name, thresholds, default):
+    '''
+    Return the allowed slowdown for a benchmark. thresholds is a list of
+    (pattern, fraction) pairs, the last matching pattern wins.
+    '''
+    rval = default
+    for pattern, fraction in thresholds:
+        if fnmatch.fnmatch(name, pattern):
+            rval = fraction
+    return rval
+
+
+def compare(results, baseline, default=0.25, thresholds=()):
+    '''
+    Compare two results documents. Returns a list of (name, baseline, result,
+    ratio) for every benchmark which got slower than its threshold allows,
+    where a threshold of 0.25 allows it to be 25% slower than the baseline.
+    '''
+    regressions = []
+    current = results['results']
+    for name, base in sorted(baseline['results'].items()):
+        if name not in current or not base:
+            continue
+        ratio = current[name] / base
+        if ratio > 1 + threshold_for(name, thresholds, default):
+            regressions.append((name, base, current[name], ratio))
+    return regressions
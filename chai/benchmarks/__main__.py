@@ -0,0 +1,108 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import sys
+
+from . import run, compare
+
+
+def parse_threshold(value):
+    '''
+    Parse a PATTERN=FRACTION threshold override.
+    '''
+    try:
+        pattern, fraction = value.rsplit('=', 1)
+        return pattern, float(fraction)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected PATTERN=FRACTION, got '%s'" % value)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m chai.benchmarks',
+        description='Run the chai micro-benchmarks.')
+    parser.add_argument(
+        '--only', action='append', metavar='PATTERN',
+        help='only run benchmarks matching this glob, can be repeated')
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help='multiply the number of iterations of every benchmark')
+    parser.add_argument(
+        '--json', metavar='PATH',
+        help="write the results as JSON to PATH, or '-' for stdout")
+    parser.add_argument(
+        '--baseline', metavar='PATH',
+        help='compare the results against a JSON file written by --json')
+    parser.add_argument(
+        '--threshold', type=float, default=0.25, metavar='FRACTION',
+        help='allowed slowdown against the baseline, default 0.25 (25%%)')
+    parser.add_argument(
+        '--threshold-for', type=parse_threshold, action='append',
+        default=[], metavar='PATTERN=FRACTION', dest='thresholds',
+        help='allowed slowdown for benchmarks matching a glob')
+    return parser.parse_args(argv)
+
+
+def report(results, out):
+    '''
+    Print the results, and the pairs which compare chai against another
+    implementation side by side.
+    '''
+    results = results['results']
+    for name in sorted(results):
+        print('%-48s %12.3f us' % (name, results[name] * 1e6), file=out)
+
+    pairs = []
+    for name in sorted(results):
+        if name.endswith('.chai'):
+            other = name[:-len('.chai')] + '.unittest_mock'
+            if other in results:
+                pairs.append((name[:-len('.chai')], results[name],
+                              'unittest.mock', results[other]))
+        elif name.endswith('.uncached') and name[:-9] in results:
+            pairs.append((name[:-9], results[name[:-9]],
+                          'uncached', results[name]))
+
+    if pairs:
+        print('', file=out)
+        for name, ours, other_name, other in pairs:
+            print('%-32s chai %10.3f us  %-13s %10.3f us  (%.2fx)' % (
+                name, ours * 1e6, other_name, other * 1e6, other / ours),
+                file=out)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    results = run(args.only, args.scale)
+
+    if args.json == '-':
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        report(results, sys.stdout)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(
+            results, baseline, args.threshold, args.thresholds)
+        for name, base, result, ratio in regressions:
+            print('REGRESSION %s: %.3f us -> %.3f us (%.2fx)' % (
+                name, base * 1e6, result * 1e6, ratio), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
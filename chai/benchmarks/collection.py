@@ -0,0 +1,64 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Benchmarks for test collection, which for chai means building test classes
+through ChaiTestType.
+'''
+import re
+
+from chai import Chai
+from chai.chai import ChaiTestType
+from . import measure
+
+
+class UncachedChaiTestType(ChaiTestType):
+
+    '''
+    ChaiTestType as it was before aliases were cached, walking dir() of every
+    base and setting every alias for each class. Kept as the reference point
+    for the speedup.
+    '''
+
+    def __init__(cls, name, bases, d):
+        type.__init__(cls, name, bases, d)
+
+        for base in bases:
+            for attr_name in dir(base):
+                d[attr_name] = getattr(base, attr_name)
+                if attr_name.startswith('assert') and attr_name != 'assert_':
+                    pieces = ['assert'] + \
+                        re.findall('[A-Z][a-z]+', attr_name[5:])
+                    name = '_'.join([s.lower() for s in pieces])
+                    d[name] = getattr(base, attr_name)
+                    setattr(cls, name, getattr(base, attr_name))
+
+        for func_name, func in d.items():
+            if func_name.startswith('test') and callable(func):
+                setattr(cls, func_name, ChaiTestType.test_wrapper(cls, func))
+
+
+def _namespace():
+    return {
+        'test_one': lambda self: None,
+        'test_two': lambda self: None,
+        'helper': lambda self: None,
+    }
+
+
+def class_creation(metaclass=ChaiTestType):
+    '''
+    Create a test class with a couple of tests on top of Chai.
+    '''
+    return metaclass('BenchTest', (Chai,), _namespace())
+
+
+def run(scale=1.0):
+    return {
+        'collection.class_creation':
+            measure(class_creation, 1000 * scale),
+        'collection.class_creation.uncached':
+            measure(lambda: class_creation(UncachedChaiTestType),
+                    1000 * scale),
+    }
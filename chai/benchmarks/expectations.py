@@ -0,0 +1,124 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Benchmarks for matching calls against expectations, both the stub dispatch
+and the argument comparators.
+'''
+import inspect
+import types
+
+from chai.comparators import *
+from chai.expectation import ArgumentsExpectationRule
+from chai.stub import Stub, StubFunction
+from . import measure
+
+
+def _dispatch_indexed(count, **record):
+    '''
+    Calls on a stub holding a lookup table, matched through the index.
+    Passing record arguments turns on the call journal.
+    '''
+    s = Stub('benchmark')
+    if record:
+        s.record_calls(**record)
+    s.returns_map(dict((x, x) for x in range(count)))
+    key = count - 1
+    return lambda: s(key)
+
+
+def _dispatch_scanned(count):
+    '''
+    Calls on a stub whose any_order expectations all have to be walked, with
+    the last one matching.
+    '''
+    s = Stub('benchmark')
+    for x in range(count):
+        s.expect().args(Any(x)).any_order().at_least(0)
+    key = count - 1
+    return lambda: s(key)
+
+
+def _dispatch_ordered(count):
+    '''
+    Calls working through a sequence of ordered expectations, one call each.
+    '''
+    s = Stub('benchmark')
+    for x in range(count):
+        s.expect().args(x).times(1)
+    calls = iter(range(count))
+    return lambda: s(next(calls))
+
+
+def _target(a, b=2, *args, **kwargs):
+    pass
+
+module = types.ModuleType('chai_benchmark_target')
+module.target = _target
+
+
+def _dispatch_autospec():
+    '''
+    Calls on an autospecced stub, which binds every call to the signature.
+    '''
+    s = StubFunction(module, 'target').autospec()
+    s.expect().args(1, b=2).any_order().at_least(0)
+    return s, lambda: module.target(1, 2)
+
+
+# A comparator and a matching value for every comparator in chai.comparators
+COMPARATORS = [
+    (Equals, lambda: Equals(42), 42),
+    (Length, lambda: Length(3), 'abc'),
+    (IsA, lambda: IsA(int), 42),
+    (Is, lambda: Is(None), None),
+    (AlmostEqual, lambda: AlmostEqual(3.14159, 2), 3.14),
+    (Regex, lambda: Regex('^f.o$'), 'foo'),
+    (Any, lambda: Any(1, 2, 42), 42),
+    (In, lambda: In([1, 2, 42]), 42),
+    (Contains, lambda: Contains(42), [1, 2, 42]),
+    (All, lambda: All(IsA(int), 42), 42),
+    (Not, lambda: Not(41), 42),
+    (Function, lambda: Function(lambda v: v == 42), 42),
+    (Ignore, lambda: Ignore(), 42),
+    (Variable, lambda: Variable('benchmark'), 42),
+    (Like, lambda: Like({'a': 1}), {'a': 1, 'b': 2}),
+]
+
+
+def _validate(comparator, value):
+    rule = ArgumentsExpectationRule(comparator)
+    return lambda: rule.validate(value)
+
+
+def run(scale=1.0):
+    results = {}
+    number = 10000 * scale
+    for count in (1, 100, 10000):
+        results['expectations.dispatch.indexed.%d' % count] = \
+            measure(_dispatch_indexed(count), number)
+        results['expectations.dispatch.scanned.%d' % count] = \
+            measure(_dispatch_scanned(count), max(5, number / count))
+
+    results['expectations.dispatch.recorded'] = \
+        measure(_dispatch_indexed(100, capacity=100), number)
+    results['expectations.dispatch.recorded.summarized'] = \
+        measure(_dispatch_indexed(100, capacity=100, summarize=True), number)
+
+    if hasattr(inspect, 'signature'):
+        s, call = _dispatch_autospec()
+        results['expectations.dispatch.autospec'] = measure(call, number)
+        s.teardown()
+
+    # Every call consumes an expectation, so there's one for each call that
+    # measure() will make.
+    results['expectations.dispatch.ordered'] = \
+        measure(_dispatch_ordered(int(max(1, number) * 5)), number)
+
+    for klass, build, value in COMPARATORS:
+        results['expectations.validate.%s' % klass.__name__] = \
+            measure(_validate(build(), value), 20000 * scale)
+    Variable.clear()
+
+    return results
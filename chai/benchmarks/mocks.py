@@ -0,0 +1,30 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Benchmarks for Mock objects.
+'''
+from chai.mock import Mock
+from chai.stub import stub
+from . import measure
+
+
+def _attribute_chain():
+    Mock().query.filter.order_by.limit.all
+
+
+def _special_method():
+    m = Mock()
+    s = stub(m.__len__)
+    s.expect().returns(3).at_least(0)
+    return lambda: len(m)
+
+
+def run(scale=1.0):
+    return {
+        'mocks.attribute_chain':
+            measure(_attribute_chain, 10000 * scale),
+        'mocks.special_method':
+            measure(_special_method(), 20000 * scale),
+    }
@@ -0,0 +1,118 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Benchmarks for creating and tearing down each type of stub.
+'''
+import types
+
+from chai.chai import Chai
+from chai.stub import stub, stub_all, StubMethod, StubFunction, StubNew, \
+    StubProperty, StubWrapperDescriptor
+from . import measure, measure_each
+
+
+class Target(object):
+
+    def method(self):
+        pass
+
+    def other(self):
+        pass
+
+    @property
+    def prop(self):
+        return 3
+
+
+def function():
+    pass
+
+module = types.ModuleType('chai_benchmark_target')
+module.function = function
+
+
+class Case(Chai):
+
+    def runTest(self):
+        pass
+
+
+def _create(stub_type, *args):
+    def create():
+        stub_type(*args).teardown()
+    return create
+
+
+def _resolve(*args):
+    def resolve():
+        rval = stub(*args)
+        for s in (rval if isinstance(rval, tuple) else (rval,)):
+            s.teardown()
+    return resolve
+
+
+def _resolve_all(obj):
+    def resolve():
+        stub_all(obj).teardown()
+    return resolve
+
+
+def _stubbed(count):
+    def setup():
+        targets = [Target() for _ in range(count)]
+        stubs = []
+        for target in targets:
+            s = StubMethod(target, 'method')
+            s.expect().args(1).returns(2)
+            stubs.append(s)
+        return stubs
+    return setup
+
+
+def _teardown(stubs):
+    for s in stubs:
+        s.unmet_expectations()
+        s.teardown()
+
+
+def _chai_test(count):
+    def test():
+        case = Case()
+        case.setUp()
+        for _ in range(count):
+            case.expect(Target().method).returns(1)
+        case.tearDown()
+    return test
+
+
+def run(scale=1.0):
+    target = Target()
+    return {
+        'stubs.create.StubMethod':
+            measure(_create(StubMethod, target, 'method'), 5000 * scale),
+        'stubs.create.StubFunction':
+            measure(_create(StubFunction, module, 'function'), 5000 * scale),
+        'stubs.create.StubNew':
+            measure(_create(StubNew, Target), 5000 * scale),
+        'stubs.create.StubProperty':
+            measure(_create(StubProperty, Target, 'prop'), 5000 * scale),
+        'stubs.create.StubWrapperDescriptor':
+            measure(_create(StubWrapperDescriptor, Target, '__init__'),
+                    5000 * scale),
+        'stubs.resolve.attr':
+            measure(_resolve(target, 'method'), 5000 * scale),
+        'stubs.resolve.attrs':
+            measure(_resolve(target, 'method', 'other'), 5000 * scale),
+        'stubs.resolve.all':
+            measure(_resolve_all(target), 5000 * scale),
+        'stubs.resolve.obj':
+            measure(_resolve(target.method), 5000 * scale),
+        'stubs.teardown.10':
+            measure_each(_stubbed(10), _teardown, 200 * scale),
+        'stubs.chai_test.10':
+            measure(_chai_test(10), 200 * scale),
+        'stubs.chai_test.1000':
+            measure(_chai_test(1000), 5 * scale),
+    }
@@ -0,0 +1,109 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Stress test calling one stub from many threads, with and without
+Stub.thread_safe. Run it directly to see calls/sec and how many calls the
+expectations counted
+
+    python -m chai.benchmarks.threads
+'''
+from __future__ import print_function
+
+import sys
+import threading
+import timeit
+from collections import namedtuple
+
+from chai.stub import Stub
+
+
+class StressResult(namedtuple('StressResult', 'seconds calls counted met')):
+
+    '''
+    The outcome of a stress run. counted is the number of calls the
+    expectation counted, met is whether its times() assertion passed.
+    '''
+
+    __slots__ = ()
+
+    @property
+    def calls_per_second(self):
+        return self.calls / self.seconds if self.seconds else 0.0
+
+    @property
+    def lost(self):
+        return self.calls - self.counted
+
+
+def stress(thread_count, calls_per_thread, thread_safe=True):
+    '''
+    Call one stub with a times() expectation from thread_count threads which
+    all start at once.
+    '''
+    s = Stub('benchmark')
+    if thread_safe:
+        s.thread_safe()
+    total = thread_count * calls_per_thread
+    exp = s.expect().args(1).returns(2).times(total)
+
+    start = threading.Event()
+
+    def worker():
+        start.wait()
+        for _ in range(calls_per_thread):
+            s(1)
+
+    # Switch threads often to make races likely
+    interval = getattr(sys, 'getswitchinterval', None)
+    if interval:
+        old_interval = interval()
+        sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=worker)
+                   for _ in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        began = timeit.default_timer()
+        start.set()
+        for thread in threads:
+            thread.join()
+        seconds = timeit.default_timer() - began
+    finally:
+        if interval:
+            sys.setswitchinterval(old_interval)
+
+    return StressResult(seconds, total, exp._run_count,
+                        not s.unmet_expectations())
+
+
+def run(scale=1.0):
+    calls = max(1, int(500 * scale))
+    results = {}
+    for thread_count in (1, 32):
+        locked = stress(thread_count, calls, thread_safe=True)
+        if locked.lost or not locked.met:
+            raise AssertionError('thread-safe stub lost %d of %d calls' % (
+                locked.lost, locked.calls))
+        unlocked = stress(thread_count, calls, thread_safe=False)
+        results['threads.thread_safe.%d' % thread_count] = \
+            locked.seconds / locked.calls
+        results['threads.unsafe.%d' % thread_count] = \
+            unlocked.seconds / unlocked.calls
+    return results
+
+
+def main(scale=1.0):
+    calls = max(1, int(2000 * scale))
+    for thread_safe in (True, False):
+        for thread_count in (1, 8, 32):
+            result = stress(thread_count, calls, thread_safe)
+            print('%-12s %3d threads %12.0f calls/sec  counted %d of %d%s' % (
+                'thread_safe' if thread_safe else 'unsafe', thread_count,
+                result.calls_per_second, result.counted, result.calls,
+                '' if result.met else '  (times() not met)'))
+
+
+if __name__ == '__main__':
+    main()
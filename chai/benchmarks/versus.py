@@ -0,0 +1,87 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+The same operations in chai and in unittest.mock, side by side. Results are
+named versus.<operation>.chai and versus.<operation>.unittest_mock. Skipped
+if neither unittest.mock nor the mock backport is available.
+'''
+try:
+    from unittest import mock
+except ImportError:
+    try:
+        import mock
+    except ImportError:
+        mock = None
+
+from chai.mock import Mock
+from chai.stub import stub
+from . import measure
+
+
+class Target(object):
+
+    def method(self, arg):
+        return arg
+
+
+def chai_stub_and_call():
+    def op():
+        target = Target()
+        s = stub(target.method)
+        s.expect().args(1).returns(2)
+        target.method(1)
+        s.teardown()
+    return op
+
+
+def mock_stub_and_call():
+    def op():
+        target = Target()
+        with mock.patch.object(target, 'method', return_value=2) as method:
+            target.method(1)
+            method.assert_called_once_with(1)
+    return op
+
+
+def chai_call():
+    target = Target()
+    s = stub(target.method)
+    s.expect().args(1).returns(2).at_least(0)
+    return lambda: target.method(1)
+
+
+def mock_call():
+    target = Target()
+    mock.patch.object(target, 'method', return_value=2).start()
+    return lambda: target.method(1)
+
+
+def chai_attribute_chain():
+    return lambda: Mock().query.filter.order_by.limit.all
+
+
+def mock_attribute_chain():
+    return lambda: mock.Mock().query.filter.order_by.limit.all
+
+
+# Each operation is named, with a factory for the chai and unittest.mock
+# versions of it and the number of times to run it.
+OPERATIONS = [
+    ('stub_and_call', chai_stub_and_call, mock_stub_and_call, 2000),
+    ('call', chai_call, mock_call, 20000),
+    ('attribute_chain', chai_attribute_chain, mock_attribute_chain, 2000),
+]
+
+
+def run(scale=1.0):
+    if mock is None:
+        return {}
+
+    results = {}
+    for name, chai_op, mock_op, number in OPERATIONS:
+        results['versus.%s.chai' % name] = measure(chai_op(), number * scale)
+        results['versus.%s.unittest_mock' % name] = \
+            measure(mock_op(), number * scale)
+    return results
@@ -0,0 +1,120 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Budgets limit the total number of calls to a group of stubs, to catch call
+amplification such as N+1 queries that are spread across several entry
+points.
+'''
+from __future__ import absolute_import
+
+from .stub import Stub, StubGroup
+from .expectation import Expectation
+from .exception import ExpectationNotSatisfied
+from ._termcolor import colored
+
+
+class _Member(object):
+
+    '''
+    A stub attached to a budget, and the calls to it since.
+    '''
+
+    __slots__ = ('budget', 'stub', 'calls')
+
+    def __init__(self, budget, stub):
+        self.budget = budget
+        self.stub = stub
+        self.calls = 0
+
+    @property
+    def name(self):
+        return self.stub.describe()
+
+
+class Budget(object):
+
+    '''
+    A limit on the total number of calls to all of the stubs attached to it.
+    Every call to a member counts, whether or not an expectation matched it.
+    Like a stub, the budget is checked with unmet_expectations() once the
+    test has run, and reports the calls to each member if it was exceeded.
+    '''
+
+    def __init__(self, name, max_calls):
+        self.name = name
+        self.max_calls = max_calls
+        self._members = []
+
+    def attach(self, *members):
+        '''
+        Count the calls to stubs against this budget. Each member can be a
+        stub, an expectation or spy, whose stub is attached, or the StubGroup
+        returned by stub_all. Returns the budget.
+        '''
+        for member in members:
+            if isinstance(member, StubGroup):
+                stubs = list(member.stubs.values())
+            elif isinstance(member, Expectation):
+                stubs = [member._stub]
+            elif isinstance(member, Stub):
+                stubs = [member]
+            else:
+                raise TypeError(
+                    "can't attach %r to budget %s, expected a stub, "
+                    "expectation or StubGroup" % (member, self.name))
+
+            for stub in stubs:
+                if any(m.stub is stub for m in self._members):
+                    continue
+                entry = _Member(self, stub)
+                self._members.append(entry)
+                stub._budgets = (stub._budgets or []) + [entry]
+                stub._instrument()
+        return self
+
+    @property
+    def calls(self):
+        '''
+        The total number of calls to the members.
+        '''
+        return sum(m.calls for m in self._members)
+
+    def breakdown(self):
+        '''
+        The number of calls to each member as a list of (name, calls), in the
+        order they were attached.
+        '''
+        return [(m.name, m.calls) for m in self._members]
+
+    def exceeded(self):
+        return self.calls > self.max_calls
+
+    def unmet_expectations(self):
+        '''
+        A list with the failure of the budget if it was exceeded, else empty.
+        '''
+        if self.exceeded():
+            return [ExpectationNotSatisfied(self)]
+        return []
+
+    def teardown(self):
+        '''
+        Stop counting calls. The counts so far are kept.
+        '''
+        for entry in self._members:
+            stub = entry.stub
+            if stub._budgets:
+                stub._budgets = [m for m in stub._budgets if m is not entry]
+                stub._instrument()
+
+    def __str__(self):
+        exceeded = self.exceeded()
+        lines = [colored("budget %s - %s" % (
+            self.name, "Exceeded" if exceeded else "Passed"),
+            "red" if exceeded else "green"),
+            "\t   Calls: %s, Max Calls: %s" % (self.calls, self.max_calls)]
+        for name, calls in self.breakdown():
+            lines.append("\t  %s: %s" % (name, calls))
+        return "\n\t" + "\n\t".join(lines)
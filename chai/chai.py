@@ -15,11 +15,17 @@ import re
 import sys
 import inspect
 import traceback
-from collections import deque
+import weakref
 
 from .exception import *
 from .mock import Mock
-from .stub import stub
+from .stub import stub, stub_all, StubGroup
+from .clock import Clock
+from .budget import Budget
+from .registry import Registry, MockRegistry
+from .scope import Scope
+from . import stats
+from .expectation import _async
 from .comparators import *
 
 
@@ -30,26 +36,81 @@ class ChaiTestType(type):
     assert_expectations in the correct context.
     """
 
+    # For each class that has been used as a base, the assert aliases and
+    # test methods that a subclass still has to set up for itself. Computed
+    # once per class and shared by all of its subclasses.
+    _base_cache = weakref.WeakKeyDictionary()
+
+    # The snake_case alias of every assert method name seen so far.
+    _alias_names = {}
+
     def __init__(cls, name, bases, d):
         type.__init__(cls, name, bases, d)
 
-        # also get all the attributes from the base classes to account
-        # for a case when test class is not the immediate child of Chai
-        # also alias all the cAmElCaSe methods to more helpful ones
+        # Alias all the cAmElCaSe methods of the base classes to more helpful
+        # ones, and wrap their test methods to account for a case when the
+        # test class is not the immediate child of Chai. Anything defined on
+        # the class itself takes precedence.
         for base in bases:
-            for attr_name in dir(base):
-                d[attr_name] = getattr(base, attr_name)
-                if attr_name.startswith('assert') and attr_name != 'assert_':
-                    pieces = ['assert'] + \
-                        re.findall('[A-Z][a-z]+', attr_name[5:])
-                    name = '_'.join([s.lower() for s in pieces])
-                    d[name] = getattr(base, attr_name)
-                    setattr(cls, name, getattr(base, attr_name))
+            aliases, tests = ChaiTestType._base_attrs(base)
+            for alias, attr_name in aliases:
+                if alias not in d:
+                    setattr(cls, alias, getattr(base, attr_name))
+            for func_name in tests:
+                if func_name not in d:
+                    setattr(cls, func_name, ChaiTestType.test_wrapper(
+                        cls, getattr(base, func_name)))
 
         for func_name, func in d.items():
             if func_name.startswith('test') and callable(func):
                 setattr(cls, func_name, ChaiTestType.test_wrapper(cls, func))
 
+    @staticmethod
+    def _alias(attr_name):
+        '''
+        Return the snake_case alias for a cAmElCaSe assert method name.
+        '''
+        alias = ChaiTestType._alias_names.get(attr_name)
+        if alias is None:
+            pieces = ['assert'] + re.findall('[A-Z][a-z]+', attr_name[5:])
+            alias = ChaiTestType._alias_names[attr_name] = \
+                '_'.join([s.lower() for s in pieces])
+        return alias
+
+    @staticmethod
+    def _base_attrs(base):
+        '''
+        Return the (alias, attribute name) pairs and test method names that a
+        subclass of base has to set up. Aliases that base already has and
+        tests that are already wrapped are inherited as they are, so for
+        subclasses of Chai classes this is usually empty.
+        '''
+        try:
+            return ChaiTestType._base_cache[base]
+        except (KeyError, TypeError):
+            pass
+
+        aliases = {}
+        tests = []
+        for attr_name in dir(base):
+            if attr_name.startswith('assert') and attr_name != 'assert_':
+                aliases[ChaiTestType._alias(attr_name)] = attr_name
+            elif attr_name.startswith('test'):
+                func = getattr(base, attr_name)
+                if callable(func) and \
+                        not getattr(func, '_chai_test_wrapper', False):
+                    tests.append(attr_name)
+
+        rval = (
+            [(alias, attr_name) for alias, attr_name in aliases.items()
+             if not hasattr(base, alias)],
+            tests)
+        try:
+            ChaiTestType._base_cache[base] = rval
+        except TypeError:
+            pass
+        return rval
+
     @staticmethod
     def test_wrapper(cls, func):
         """
@@ -60,7 +121,10 @@ class ChaiTestType(type):
 
         def wrapper(self, *args, **kwargs):
             try:
-                func(self, *args, **kwargs)
+                rval = func(self, *args, **kwargs)
+                # Coroutine test methods
+                if _async is not None and inspect.isawaitable(rval):
+                    self._run_coroutine(rval)
             except UnexpectedCall as e:
                 # if this is not python3, use python2 syntax
                 if not hasattr(e, '__traceback__'):
@@ -75,18 +139,7 @@ class ChaiTestType(type):
                 # would be called during exception handling (e.g. "open"),
                 # the original method is used. Without, recursion limits are
                 # common with little insight into what went wrong.
-                exceptions = []
-                try:
-                    for s in self._stubs:
-                        # Make sure we collect any unmet expectations before
-                        # teardown.
-                        exceptions.extend(s.unmet_expectations())
-                        s.teardown()
-                except:
-                    # A rare case where this is about the best that can be
-                    # done, as we don't want to supersede the actual
-                    # exception if there is one.
-                    traceback.print_exc()
+                exceptions = self._verify_chai()
 
             if exceptions:
                 raise ExpectationNotSatisfied(*exceptions)
@@ -95,15 +148,19 @@ class ChaiTestType(type):
         wrapper.__doc__ = func.__doc__
         wrapper.__module__ = func.__module__
         wrapper.__wrapped__ = func
+        wrapper._chai_test_wrapper = True
         if getattr(func, '__unittest_skip__', False):
             wrapper.__unittest_skip__ = True
             wrapper.__unittest_skip_why__ = func.__unittest_skip_why__
         return wrapper
 
 
-class ChaiBase(unittest.TestCase):
+class ChaiMixin(object):
     '''
-    Base class for all tests
+    The stubbing, mocking and comparators of a Chai test, without any tie to
+    a test framework. Whatever runs the test calls _setup_chai() before it,
+    _verify_chai() once it has run and _teardown_chai() after it, all in
+    the same thread.
     '''
 
     # Load in the comparators
@@ -124,96 +181,178 @@ class ChaiBase(unittest.TestCase):
     var = Variable
     like = Like
 
-    def setUp(self):
-        super(ChaiBase, self).setUp()
-
+    # Set to True in a test class to run each test with a VirtualEventLoop as
+    # the current event loop, available as self.loop. Coroutine test methods
+    # are run on it.
+    virtual_loop = False
+    loop = None
+    _previous_loop = None
+
+    # Set to True in a test class to collect stats on every stub, see
+    # Stub.collect_stats. After each test its report is in stats_report,
+    # and if stats_path is set it's written there along with those of the
+    # other tests, as 'json' or 'prometheus' according to stats_format.
+    collect_stats = False
+    stats_path = None
+    stats_format = 'json'
+    stats_report = None
+
+    _scope = None
+
+    def _setup_chai(self):
+        '''
+        Prepare for a test.
+        '''
         # Setup stub tracking
-        self._stubs = deque()
+        self._stubs = Registry()
 
         # Setup mock tracking
-        self._mocks = deque()
-
-        # Try to load this into the module that the test case is defined in, so
-        # that 'self.' can be removed. This has to be done at the start of the
-        # test because we need the reference to be correct at the time of test
-        # run, not when the class is defined or an instance is created. Walks
-        # through the method resolution order to set it on every module for
-        # Chai subclasses to handle when tests are defined in subclasses.
-        for cls in inspect.getmro(self.__class__):
-            if cls.__module__.startswith('chai'):
-                break
-            mod = sys.modules[cls.__module__]
-            for attr in dir(cls):
-                if hasattr(mod, attr):
-                    continue
-                if attr.startswith('assert'):
-                    setattr(mod, attr, getattr(self, attr))
-                elif isinstance(getattr(self, attr), type) and \
-                        issubclass(getattr(self, attr), Comparator):
-                    setattr(mod, attr, getattr(self, attr))
-            if not hasattr(mod, 'stub'):
-                setattr(mod, 'stub', self.stub)
-            if not hasattr(mod, 'expect'):
-                setattr(mod, 'expect', self.expect)
-            if not hasattr(mod, 'spy'):
-                setattr(mod, 'spy', self.spy)
-            if not hasattr(mod, 'mock'):
-                setattr(mod, 'mock', self.mock)
+        self._mocks = MockRegistry()
 
-    # Because cAmElCaSe sucks
-    setup = setUp
+        # Variables and other state that's private to this test, current
+        # from here until _teardown_chai so that setUp and tearDown share it
+        # with the test method.
+        self._scope = Scope().enter()
 
-    def tearDown(self):
-        super(ChaiBase, self).tearDown()
+        self._clock = None
 
-        for cls in inspect.getmro(self.__class__):
-            if cls.__module__.startswith('chai'):
-                break
-            mod = sys.modules[cls.__module__]
+        if self.virtual_loop:
+            import asyncio
+            from .loop import VirtualEventLoop, current_event_loop
+            # Set again once the test is torn down
+            self._previous_loop = current_event_loop()
+            self.loop = VirtualEventLoop()
+            asyncio.set_event_loop(self.loop)
 
-            if getattr(mod, 'stub', None) == self.stub:
-                delattr(mod, 'stub')
-            if getattr(mod, 'expect', None) == self.expect:
-                delattr(mod, 'expect')
-            if getattr(mod, 'spy', None) == self.spy:
-                delattr(mod, 'spy')
-            if getattr(mod, 'mock', None) == self.mock:
-                delattr(mod, 'mock')
+    def _verify_chai(self):
+        '''
+        Collect the unmet expectations of every stub and tear the stubs down.
+        Returns the unmet expectations.
+        '''
+        exceptions = []
+        try:
+            for s in self._stubs:
+                # Make sure we collect any unmet expectations before
+                # teardown.
+                exceptions.extend(s.unmet_expectations())
+                self._stubs.restore(s)
+        except:
+            # A rare case where this is about the best that can be
+            # done, as we don't want to supersede the actual
+            # exception if there is one.
+            traceback.print_exc()
+        return exceptions
+
+    def _teardown_chai(self):
+        '''
+        Undo everything done for a test, whether or not it ran.
+        '''
+        self.stats_report = self._stats_report()
+        if self.stats_report is not None and self.stats_path:
+            stats.add(self.stats_report, self.stats_path, self.stats_format)
 
-        # Docs insist that this will be called no matter what happens in
-        # runTest(), so this should be a safe spot to unstub everything.
-        # Even with teardown at the end of test_wrapper, tear down here in
-        # case the test was skipped or there was otherwise a problem with
-        # that test.
-        while len(self._stubs):
-            stub = self._stubs.popleft()
-            stub.teardown()  # Teardown the reset of the stub
-
-        # Do the mocks in reverse order in the rare case someone called
-        # mock(obj,attr) twice.
-        while len(self._mocks):
-            mock = self._mocks.pop()
-            if len(mock) == 2:
-                delattr(mock[0], mock[1])
-            else:
-                setattr(mock[0], mock[1], mock[2])
+        # Stubs that _verify_chai already tore down are skipped
+        self._stubs.restore_all()
+        self._mocks.restore_all()
 
         # Clear out any cached variables
         Variable.clear()
+        if self._scope is not None:
+            # Makes the scope which was current before current again, and
+            # releases this one.
+            self._scope.exit()
+            self._scope = None
+
+        if self.loop is not None:
+            import asyncio
+            asyncio.set_event_loop(self._previous_loop)
+            self._previous_loop = None
+            self.loop.close()
+            self.loop = None
+
+    def _stats_report(self):
+        stubs = []
+        for s in self._stubs:
+            if isinstance(s, StubGroup):
+                stubs.extend(s.stubs.values())
+            else:
+                stubs.append(s)
+        return stats.report(self._test_id(), stubs)
 
-    # Because cAmElCaSe sucks
-    teardown = tearDown
+    def _test_id(self):
+        return type(self).__name__
+
+    def clock(self, start=None, modules=()):
+        '''
+        Stub time.time, time.monotonic, time.perf_counter and time.sleep, and
+        the _ns variants, with a virtual chai.clock.Clock which sleep moves
+        forward instantly. Modules which imported any of those functions
+        directly can be passed in modules to stub them there too. If the
+        test has a virtual loop, the clock is shared with it. Returns the
+        clock, and the same clock if called again.
+        '''
+        if self._clock is None:
+            if self.loop is not None:
+                self._clock = self.loop.clock
+            else:
+                self._clock = Clock(start)
+            self._clock.install(self.stub, modules)
+        return self._clock
+
+    def _run_coroutine(self, coro):
+        '''
+        Run a coroutine test method to completion, on the virtual loop if the
+        test has one or else on a new event loop.
+        '''
+        if self.loop is not None:
+            return self.loop.run_until_complete(coro)
+
+        import asyncio
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            loop.close()
 
-    def stub(self, obj, attr=None):
+    def stub(self, obj, attr=None, *attrs):
         '''
         Stub an object. If attr is not None, will attempt to stub that
         attribute on the object. Only required for modules and other rare
-        cases where we can't determine the binding from the object.
+        cases where we can't determine the binding from the object. If more
+        attribute names are given, stubs all of them and returns a tuple.
         '''
-        s = stub(obj, attr)
-        if s not in self._stubs:
-            self._stubs.append(s)
-        return s
+        rval = stub(obj, attr, *attrs)
+        for s in (rval if attrs else (rval,)):
+            self._stubs.add(s)
+            if self.collect_stats and s._stats is None:
+                s.collect_stats()
+        return rval
+
+    def stub_all(self, obj, include=None, exclude=None):
+        '''
+        Stub every method or function of an object whose name matches the
+        glob patterns in include and not those in exclude, see
+        chai.stub.stub_all. Returns a chai.stub.StubGroup of the stubs,
+        which are checked and torn down together at the end of the test.
+        '''
+        rval = stub_all(obj, include, exclude)
+        self._stubs.add(rval)
+        if self.collect_stats:
+            for s in rval.stubs.values():
+                s.collect_stats()
+        return rval
+
+    def budget(self, name, max_calls, *members):
+        '''
+        Limit the total number of calls to several stubs to max_calls. The
+        members can be stubs, expectations or spies, or the result of
+        stub_all, and more can be added with attach(). If the members were
+        called more often, the test fails with the number of calls to each.
+        Returns the chai.budget.Budget.
+        '''
+        rval = Budget(name, max_calls).attach(*members)
+        self._stubs.add(rval)
+        return rval
 
     def expect(self, obj, attr=None):
         '''
@@ -240,12 +379,116 @@ class ChaiBase(unittest.TestCase):
 
             if hasattr(obj, attr):
                 orig = getattr(obj, attr)
-                self._mocks.append((obj, attr, orig))
+                self._mocks.add((obj, attr, orig))
                 setattr(obj, attr, rval)
             else:
-                self._mocks.append((obj, attr))
+                self._mocks.add((obj, attr))
                 setattr(obj, attr, rval)
         return rval
 
 
+class ChaiBase(ChaiMixin, unittest.TestCase):
+    '''
+    Base class for all tests
+    '''
+
+    # Set to False in a test class to keep Chai from loading assertions,
+    # comparators and the mocking methods into the modules of the class and
+    # its bases. Tests then have to use them through 'self.'.
+    inject_globals = True
+
+    # For each test class, the modules and names to load into them.
+    _injection_cache = weakref.WeakKeyDictionary()
+
+    # Mocking methods loaded into test modules along with the assertions and
+    # comparators. These are removed again at the end of each test.
+    _injected_methods = ('stub', 'stub_all', 'budget', 'expect', 'spy',
+                         'mock')
+
+    def setUp(self):
+        super(ChaiBase, self).setUp()
+        self._setup_chai()
+        # unittest doesn't call tearDown if setUp fails, so that the scope
+        # doesn't stay current, and stubs in place, for the next test.
+        self.addCleanup(self._cleanup_chai)
+
+        # Try to load this into the module that the test case is defined in, so
+        # that 'self.' can be removed. This has to be done at the start of the
+        # test because we need the reference to be correct at the time of test
+        # run, not when the class is defined or an instance is created. Walks
+        # through the method resolution order to set it on every module for
+        # Chai subclasses to handle when tests are defined in subclasses.
+        if self.inject_globals:
+            for mod, names in self._injections():
+                for attr in names:
+                    if not hasattr(mod, attr):
+                        setattr(mod, attr, getattr(self, attr))
+
+    # Because cAmElCaSe sucks
+    setup = setUp
+
+    @classmethod
+    def _injections(cls):
+        '''
+        Return a list of (module, names) for every module that this class and
+        its bases are defined in, up to Chai itself. Computed once per class.
+        '''
+        try:
+            return ChaiBase._injection_cache[cls]
+        except KeyError:
+            pass
+
+        rval = []
+        seen = set()
+        for klass in inspect.getmro(cls):
+            if klass.__module__.startswith('chai'):
+                break
+            mod = sys.modules[klass.__module__]
+            if mod in seen:
+                # dir() of a subclass already covers its bases
+                continue
+            seen.add(mod)
+
+            names = []
+            for attr in dir(klass):
+                if attr.startswith('assert'):
+                    names.append(attr)
+                else:
+                    value = getattr(klass, attr, None)
+                    if isinstance(value, type) and \
+                            issubclass(value, Comparator):
+                        names.append(attr)
+            names.extend(cls._injected_methods)
+            rval.append((mod, names))
+
+        ChaiBase._injection_cache[cls] = rval
+        return rval
+
+    def tearDown(self):
+        super(ChaiBase, self).tearDown()
+
+        if self.inject_globals:
+            for mod, names in self._injections():
+                for attr in self._injected_methods:
+                    if getattr(mod, attr, None) == getattr(self, attr):
+                        delattr(mod, attr)
+
+        # Docs insist that this will be called no matter what happens in
+        # runTest(), so this should be a safe spot to unstub everything.
+        # Even with teardown at the end of test_wrapper, tear down here in
+        # case the test was skipped or there was otherwise a problem with
+        # that test.
+        self._teardown_chai()
+
+    # Because cAmElCaSe sucks
+    teardown = tearDown
+
+    def _cleanup_chai(self):
+        if self._scope is not None:
+            ChaiBase.tearDown(self)
+
+    def _test_id(self):
+        return self.id()
+
+
 Chai = ChaiTestType('Chai', (ChaiBase,), {})
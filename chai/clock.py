@@ -0,0 +1,82 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+A virtual clock which can stand in for the time module.
+'''
+from __future__ import absolute_import
+
+import time as _time
+
+from .stub import stub as _stub
+
+# The functions of the time module that a clock replaces, those that don't
+# exist in this version of python are skipped.
+CLOCK_FUNCTIONS = ('time', 'monotonic', 'perf_counter', 'sleep',
+                   'time_ns', 'monotonic_ns', 'perf_counter_ns')
+
+
+class Clock(object):
+
+    '''
+    A clock that only moves when something sleeps or it's advanced. time()
+    starts at the real time when the clock is created, or at start, while
+    monotonic() and perf_counter() start at 0.
+    '''
+
+    def __init__(self, start=None):
+        self._start = _time.time() if start is None else start
+        self._elapsed = 0.0
+
+    def time(self):
+        return self._start + self._elapsed
+
+    def monotonic(self):
+        return self._elapsed
+
+    perf_counter = monotonic
+
+    def time_ns(self):
+        return int(self.time() * 1e9)
+
+    def monotonic_ns(self):
+        return int(self._elapsed * 1e9)
+
+    perf_counter_ns = monotonic_ns
+
+    def sleep(self, seconds):
+        '''
+        Return immediately, having moved the clock forward.
+        '''
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        '''
+        Move the clock forward.
+        '''
+        if seconds < 0:
+            raise ValueError("can't move the clock backwards")
+        self._elapsed += seconds
+
+    def install(self, stub=_stub, modules=()):
+        '''
+        Stub the functions of the time module with this clock. Modules which
+        imported any of those functions directly, e.g. with "from time import
+        sleep", can be passed in modules to have them stubbed as well. The
+        stubs are created with the stub function and returned, and have to
+        be torn down by the caller. Chai.clock does all of this.
+        '''
+        originals = [(name, getattr(_time, name)) for name in CLOCK_FUNCTIONS
+                     if hasattr(_time, name)]
+        targets = [(_time, name) for name, orig in originals]
+        for module in modules:
+            targets.extend((module, name) for name, orig in originals
+                           if getattr(module, name, None) is orig)
+
+        rval = []
+        for module, name in targets:
+            s = stub(module, name)
+            s.expect().any_order().at_least(0).side_effect(getattr(self, name))
+            rval.append(s)
+        return rval
@@ -5,6 +5,8 @@ https://github.com/agoragames/chai/blob/master/LICENSE.txt
 '''
 import re
 
+from .scope import current as _current_scope
+
 
 def build_comparators(*values_or_types):
     '''
@@ -273,19 +275,29 @@ class Ignore(Comparator):
 class Variable(Comparator):
 
     '''
-    A mechanism for tracking variables and their values.
+    A mechanism for tracking variables and their values. Values are stored in
+    the scope of the test which created the variable, see chai.scope, or in
+    _cache outside of a test.
     '''
     _cache = {}
 
     @classmethod
     def clear(self):
         '''
-        Delete all cached values. Should only be used by the test suite.
+        Delete all cached values in the current scope. Should only be used by
+        the test suite.
         '''
-        self._cache.clear()
+        scope = _current_scope()
+        if scope is not None:
+            scope.variables.clear()
+        else:
+            self._cache.clear()
 
     def __init__(self, name):
         self._name = name
+        scope = _current_scope()
+        if scope is not None:
+            self._cache = scope.variables
 
     @property
     def value(self):
@@ -47,45 +47,100 @@ class ChaiAssertion(AssertionError):
 
 class UnexpectedCall(BaseException):
     '''
-    Raised when a unexpected call occurs to a stub.
+    Raised when a unexpected call occurs to a stub. Code under test may well
+    catch and discard this, so the message is only rendered the first time
+    the exception is displayed, or its args are read. The suffix can be a
+    callable for the same reason. If the stub records its calls, history is
+    the list of the most recent ones.
     '''
 
     def __init__(self, msg=None, prefix=None, suffix=None, call=None,
                  args=None, kwargs=None, expected_args=None,
-                 expected_kwargs=None):
-        if msg:
-            msg = colored('\n\n' + msg.strip(), 'red')
+                 expected_kwargs=None, history=None):
+        super(UnexpectedCall, self).__init__()
+        self._msg = msg
+        self._prefix = prefix
+        self._suffix = suffix
+        self._call = call
+        self._args = args
+        self._kwargs = kwargs
+        self._expected_args = expected_args
+        self._expected_kwargs = expected_kwargs
+        self._history = history or []
+        self._str = None
+
+        # The exception being handled when this is raised is its __context__
+        # in python 3, python 2 has to hold onto it.
+        self._exc_info = None
+        if sys.version_info[0] < 3 and sys.exc_info()[0]:
+            self._exc_info = sys.exc_info()
+
+    @property
+    def history(self):
+        return self._history
+
+    @property
+    def args(self):
+        return (str(self),)
+
+    @args.setter
+    def args(self, value):
+        self._str = value[0] if value else ''
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, str(self))
+
+    def __str__(self):
+        if self._str is None:
+            self._str = self._format()
+        return self._str
+
+    def _format(self):
+        if self._msg:
+            msg = colored('\n\n' + self._msg.strip(), 'red')
         else:
             msg = ''
 
-        if prefix:
-            msg = '\n\n' + prefix.strip() + msg
+        if self._prefix:
+            msg = '\n\n' + self._prefix.strip() + msg
 
-        if call:
+        if self._call:
             msg += colored('\n\nNo expectation in place for\n',
                            'white', attrs=['bold'])
-            msg += colored(call, 'red')
-            if args or kwargs:
-                msg += colored(pretty_format_args(*(args or ()),
-                                                  **(kwargs or {})), 'red')
-            if expected_args or expected_kwargs:
+            msg += colored(self._call, 'red')
+            if self._args or self._kwargs:
+                msg += colored(pretty_format_args(*(self._args or ()),
+                                                  **(self._kwargs or {})),
+                               'red')
+            if self._expected_args or self._expected_kwargs:
                 msg += colored('\n\nExpected\n', 'white', attrs=['bold'])
-                msg += colored(call, 'red')
+                msg += colored(self._call, 'red')
                 msg += colored(pretty_format_args(
-                               *(expected_args or ()),
-                               **(expected_kwargs or {})), 'red')
-
-        # If handling an exception, add printing of it here.
-        if sys.exc_info()[0]:
+                               *(self._expected_args or ()),
+                               **(self._expected_kwargs or {})), 'red')
+
+        if self._history:
+            msg += colored('\n\nRecent calls\n', 'white', attrs=['bold'])
+            msg += '\n'.join('\t%s%s' % (self._call or '', record)
+                             for record in self._history)
+
+        exc_info = self._exc_info
+        context = getattr(self, '__context__', None)
+        if context is not None:
+            exc_info = (type(context), context, context.__traceback__)
+        if exc_info:
             msg += colored('\n\nWhile handling\n', 'white', attrs=['bold'])
             msg += colored(''.join(
-                           traceback.format_exception(*sys.exc_info())),
+                           traceback.format_exception(*exc_info)),
                            'red')
 
+        suffix = self._suffix
+        if callable(suffix):
+            suffix = suffix()
         if suffix:
             msg = msg + '\n\n' + suffix.strip()
 
-        super(UnexpectedCall, self).__init__(msg)
+        return msg
 
 
 class ExpectationNotSatisfied(ChaiAssertion):
@@ -11,6 +11,12 @@ from .comparators import *
 from .exception import *
 from ._termcolor import colored
 
+try:
+    from . import _async
+except (ImportError, SyntaxError):
+    # Coroutine functions need Python 3.5
+    _async = None
+
 
 class ExpectationRule(object):
 
@@ -28,45 +34,67 @@ class ArgumentsExpectationRule(ExpectationRule):
         self.set_args(*args, **kwargs)
 
     def set_args(self, *args, **kwargs):
-        self.args = []
-        self.kwargs = {}
-
         # Convert all of the arguments to comparators
         self.args = build_comparators(*args)
         self.kwargs = dict([(k, build_comparators(v)[0])
                             for k, v in kwargs.items()])
 
-    def validate(self, *args, **kwargs):
-        self.in_args = args[:]
-        self.in_kwargs = kwargs.copy()
+        # Compile the comparators into the cheapest test that will do. When
+        # they're all plain values, comparing the tuple and dict of arguments
+        # does the whole job in one step.
+        comparators = self.args + list(self.kwargs.values())
+        if all(type(c) is Equals for c in comparators):
+            self._values = tuple(c._value for c in self.args)
+            self._kwvalues = dict(
+                (k, c._value) for k, c in self.kwargs.items())
+            self._test = self._test_values
+        else:
+            self._values = self._kwvalues = None
+            self._arg_tests = tuple(c.test for c in self.args)
+            self._kwarg_tests = tuple(
+                (k, c.test) for k, c in self.kwargs.items())
+            self._test = self._test_comparators
 
-        # First just check that the number of arguments is the same or
-        # different
-        if len(args) != len(self.args) or len(kwargs) != len(self.kwargs):
-            self._passed = False
+    def key(self):
+        '''
+        Return a hashable key of the exact arguments if every comparator is a
+        plain Equals, else None.
+        '''
+        if self._values is None:
+            return None
+
+        key = (self._values, frozenset(self._kwvalues.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _test_values(self, args, kwargs):
+        return self._values == args and self._kwvalues == kwargs
+
+    def _test_comparators(self, args, kwargs):
+        # First just check that the number of arguments is the same
+        if len(args) != len(self._arg_tests) or \
+                len(kwargs) != len(self._kwarg_tests):
             return False
 
-        for x in range(len(self.args)):
-            if not self.args[x].test(args[x]):
-                self._passed = False
+        for test, value in zip(self._arg_tests, args):
+            if not test(value):
                 return False
 
-        for arg_name, arg_test in self.kwargs.items():
-            try:
-                value = kwargs.pop(arg_name)
-            except KeyError:
-                self._passed = False
-                return False
-            if not arg_test.test(value):
-                self._passed = False
+        # Same number of keyword arguments, so if every expected name is
+        # present there are none left over.
+        for arg_name, test in self._kwarg_tests:
+            if arg_name not in kwargs or not test(kwargs[arg_name]):
                 return False
 
-        # If there are arguments left over, is error
-        if len(kwargs):
-            self._passed = False
-            return False
+        return True
 
-        self._passed = True
+    def validate(self, *args, **kwargs):
+        self.in_args = args
+        self.in_kwargs = kwargs
+        self._passed = self._test(args, kwargs)
         return self._passed
 
     @classmethod
@@ -103,6 +131,7 @@ class Expectation(object):
         self._arguments_rule = ArgumentsExpectationRule()
         self._raises = None
         self._returns = None
+        self._delay = None
         self._max_count = None
         self._min_count = 1
         self._counts_defined = False
@@ -113,6 +142,8 @@ class Expectation(object):
         self._side_effect_kwargs = None
         self._teardown = False
         self._any_args = True
+        # Set by the stub when it files the expectation for dispatch
+        self._filed = None
 
         # If the last expectation has no counts defined yet, set it to the
         # run count if it's already been used, else set it to 1 just like
@@ -140,8 +171,14 @@ class Expectation(object):
         """
         Creates a ArgumentsExpectationRule and adds it to the expectation
         """
+        if self._stub._spec is not None:
+            try:
+                args, kwargs = self._stub._bind(args, kwargs, Equals)
+            except TypeError as e:
+                raise TypeError('expectation can never match %s' % e)
         self._any_args = False
         self._arguments_rule.set_args(*args, **kwargs)
+        self._stub._reindex(self)
         return self
 
     def any_args(self):
@@ -149,6 +186,7 @@ class Expectation(object):
         Accept any arguments passed to this call.
         '''
         self._any_args = True
+        self._stub._reindex(self)
         return self
 
     def returns(self, value):
@@ -168,6 +206,31 @@ class Expectation(object):
         self._raises = exception
         return self
 
+    def returns_after(self, seconds, value):
+        """
+        Return the value through an awaitable that resolves after some seconds
+        on the event loop. Async stubs sleep before returning, other stubs
+        return a future. Use with VirtualEventLoop so no real time passes.
+        """
+        self._check_async('returns_after')
+        self._delay = seconds
+        self._returns = value
+        return self
+
+    def raises_after(self, seconds, exception):
+        """
+        Like returns_after, but the awaitable raises the exception.
+        """
+        self._check_async('raises_after')
+        self._delay = seconds
+        self._raises = exception
+        return self
+
+    def _check_async(self, modifier):
+        if _async is None:
+            raise UnsupportedModifier(
+                "%s needs asyncio and Python 3.5" % modifier)
+
     def times(self, count):
         self._min_count = self._max_count = count
         self._counts_defined = True
@@ -202,11 +265,21 @@ class Expectation(object):
 
     def any_order(self):
         self._any_order = True
+        self._stub._reindex(self)
         return self
 
     def is_any_order(self):
         return self._any_order
 
+    def _dispatch_key(self):
+        '''
+        The key under which the stub can index this expectation, or None if
+        it has to be matched by walking the expectations in order.
+        '''
+        if self._any_args or not self._any_order:
+            return None
+        return self._arguments_rule.key()
+
     def side_effect(self, func, *args, **kwargs):
         self._side_effect = func
         self._side_effect_args = args
@@ -274,28 +347,57 @@ class Expectation(object):
         Validate all the rules with in this expectation to see if this
         expectation has been met.
         """
+        return self._test(
+            not self._met and self.match(*args, **kwargs), args, kwargs)
+
+    def _test(self, matched, args, kwargs):
+        """
+        Run the expectation for a call that has already been matched against
+        its arguments, so that the stub only has to validate each call once.
+        """
+        self._account(matched)
+        return self._respond(matched, args, kwargs)
+
+    def _account(self, matched):
+        """
+        Count a matched call. Thread-safe stubs hold their lock for this but
+        not for _respond, so that side effects run concurrently.
+        """
+        if matched:
+            self._run_count += 1
+            if self._max_count is not None and \
+                    self._run_count == self._max_count:
+                self._met = True
+
+    def _respond(self, matched, args, kwargs):
+        """
+        Run the side effect and produce the result of a call after it's been
+        counted.
+        """
+        side_effect_return = None
+        if matched:
+            side_effect_return = self._run_side_effect(args, kwargs)
+        if self._delay is not None:
+            return _async.resolve_later(self, side_effect_return)
+        return self._result(side_effect_return)
+
+    def _run_side_effect(self, args, kwargs):
         side_effect_return = None
-        if not self._met:
-            if self.match(*args, **kwargs):
-                self._run_count += 1
-                if self._max_count is not None and \
-                        self._run_count == self._max_count:
-                    self._met = True
-                if self._side_effect:
-                    if self._side_effect_args or self._side_effect_kwargs:
-                        side_effect_return = self._side_effect(
-                            *self._side_effect_args,
-                            **self._side_effect_kwargs)
-                    else:
-                        side_effect_return = self._side_effect(*args, **kwargs)
+        if self._side_effect:
+            if self._side_effect_args or self._side_effect_kwargs:
+                side_effect_return = self._side_effect(
+                    *self._side_effect_args,
+                    **self._side_effect_kwargs)
             else:
-                self._met = False
+                side_effect_return = self._side_effect(*args, **kwargs)
 
-            # If this is met and we're supposed to tear down, must do it now
-            # so that this stub is not called again
-            if self._met and self._teardown:
-                self._stub.teardown()
+        # If this is met and we're supposed to tear down, must do it now
+        # so that this stub is not called again
+        if self._met and self._teardown:
+            self._stub.teardown()
+        return side_effect_return
 
+    def _result(self, side_effect_return):
         # return_value has priority to not break existing uses of side effects
         rval = self.return_value()
         if rval is None:
@@ -309,6 +411,8 @@ class Expectation(object):
         return_string = "  Raises: %s" % (
             self._raises if self._raises else " Returns: %s" % repr(
                 self._returns))
+        if self._delay is not None:
+            return_string += " after %ss" % self._delay
         return "\n\t%s\n\t%s\n\t\t%s\n\t\t%s" % (
             colored("%s - %s" % (
                 self._stub.name,
@@ -0,0 +1,125 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+An asyncio event loop with a virtual clock. Whenever the loop would wait
+for a timer it jumps straight to it instead, so that sleeps, timeouts and
+backoff run without waiting in real time. Real I/O still works. While work
+is running in an executor the loop waits for it in real time, and only
+moves the clock on once a timer is due for real. Sockets and pipes, which
+may well sit idle, are only given a moment in real time before the clock
+moves on.
+'''
+from __future__ import absolute_import
+
+import asyncio
+import selectors
+
+from .clock import Clock
+
+
+class _VirtualSelector(selectors.BaseSelector):
+
+    '''
+    Wraps a real selector. Polls it without blocking and, if nothing is
+    ready, advances the loop's clock by the time the loop would have waited.
+    '''
+
+    # The most time in seconds to wait for sockets in real time before
+    # moving the clock on.
+    io_poll = 0.01
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+        # The loop's own files, which it registers when it's created
+        self._internal = 0
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            # Nothing is scheduled, so only real I/O can wake the loop.
+            return self._selector.select(None)
+        if self._loop._executor_calls > 0:
+            # Give work in executors the time it would have had, so that
+            # timeouts on it don't expire at once.
+            ready = self._selector.select(timeout)
+        elif len(self._selector.get_map()) > self._internal:
+            ready = self._selector.select(min(timeout, self.io_poll))
+        if ready:
+            return ready
+        self._loop.advance(timeout)
+        return ready
+
+    def close(self):
+        self._selector.close()
+
+    def get_key(self, fileobj):
+        return self._selector.get_key(fileobj)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+
+def current_event_loop():
+    '''
+    Return the event loop set for this thread, or None. Unlike
+    asyncio.get_event_loop(), never makes one.
+    '''
+    policy = asyncio.get_event_loop_policy()
+    local = getattr(policy, '_local', None)
+    if local is not None:
+        return getattr(local, '_loop', None)
+    try:
+        return policy.get_event_loop()
+    except RuntimeError:
+        return None
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+
+    '''
+    An event loop whose time() only moves when the loop has nothing to do but
+    wait for a timer, or when advance() is called. Its time is the
+    monotonic() of a chai.clock.Clock, which can be shared with the stubs of
+    the time module so that both move together.
+    '''
+
+    def __init__(self, clock=None):
+        self.clock = Clock() if clock is None else clock
+        self._executor_calls = 0
+        selector = _VirtualSelector(self)
+        super(VirtualEventLoop, self).__init__(selector)
+        selector._internal = len(selector.get_map())
+
+    def time(self):
+        return self.clock.monotonic()
+
+    def run_in_executor(self, executor, func, *args):
+        future = super(VirtualEventLoop, self).run_in_executor(
+            executor, func, *args)
+        self._executor_calls += 1
+        future.add_done_callback(self._executor_done)
+        return future
+
+    def _executor_done(self, future):
+        self._executor_calls -= 1
+
+    def advance(self, seconds):
+        '''
+        Move the clock forward. Timers that are now due run on the next
+        iteration of the loop.
+        '''
+        self.clock.advance(seconds)
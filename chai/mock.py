@@ -13,10 +13,26 @@ class Mock(object):
     A class where all calls are stubbed.
     '''
 
+    # Attribute mocks only keep a reference to their parent and the name they
+    # were looked up by, the full name is only needed for error messages.
+    __slots__ = ('_parent', '_label', '__dict__', '__weakref__')
+
     def __init__(self, **kwargs):
+        self._parent = None
+        self._label = 'mock'
         for name, value in kwargs.items():
             setattr(self, name, value)
-        self._name = 'mock'
+
+    @property
+    def _name(self):
+        if self._parent is None:
+            return self._label
+        return '%s.%s' % (self._parent._name, self._label)
+
+    @_name.setter
+    def _name(self, name):
+        self._parent = None
+        self._label = name
 
     # For whatever reason, new-style objects require this method defined before
     # any instance is created. Defining it through __getattr__ is not enough.
@@ -25,28 +41,32 @@ class Mock(object):
     # Also, if it's already defined on the instance, getattr() will return
     # the stub but the original method will always be called. Anyway, it's
     # all crazy, but that's why the implementation of __call__ is so weird.
+    # Stubbing a special method puts the stub in the instance __dict__, so
+    # that's where all of them look for it.
     def __call__(self, *args, **kwargs):
-        if isinstance(getattr(self, '__call__'), Stub):
-            return getattr(self, '__call__')(*args, **kwargs)
+        stub = self.__dict__.get('__call__')
+        if isinstance(stub, Stub):
+            return stub(*args, **kwargs)
 
         raise UnexpectedCall(call=self._name, args=args, kwargs=kwargs)
 
     def __getattr__(self, name):
-        rval = self.__dict__.get(name)
-
-        if not rval or not isinstance(rval, (Stub, Mock)):
-            rval = Mock()
-            rval._name = '%s.%s' % (self._name, name)
-            setattr(self, name, rval)
-
+        # Only called when the attribute isn't already set on the mock.
+        if name == '_parent' or name == '_label':
+            raise AttributeError(name)
+        rval = object.__new__(Mock)
+        rval._parent = self
+        rval._label = name
+        self.__dict__[name] = rval
         return rval
 
     ###
     # Define nonzero so that basic "if <mock>:" stanzas will work.
     ###
     def __nonzero__(self):
-        if isinstance(getattr(self, '__nonzero__'), Stub):
-            return getattr(self, '__nonzero__')()
+        stub = self.__dict__.get('__nonzero__')
+        if isinstance(stub, Stub):
+            return stub()
         return True
 
     ###
@@ -58,39 +78,46 @@ class Mock(object):
     # decorator but that gets in the way of stubbing. Would like to figure
     # that out @AW
     def __len__(self):
-        if isinstance(getattr(self, '__len__'), Stub):
-            return getattr(self, '__len__')()
+        stub = self.__dict__.get('__len__')
+        if isinstance(stub, Stub):
+            return stub()
         raise UnexpectedCall(call=self._name + '.__len__')
 
     def __getitem__(self, key):
-        if isinstance(getattr(self, '__getitem__'), Stub):
-            return getattr(self, '__getitem__')(key)
+        stub = self.__dict__.get('__getitem__')
+        if isinstance(stub, Stub):
+            return stub(key)
         raise UnexpectedCall(call=self._name + '.__getitem__', args=(key,))
 
     def __setitem__(self, key, value):
-        if isinstance(getattr(self, '__setitem__'), Stub):
-            return getattr(self, '__setitem__')(key, value)
+        stub = self.__dict__.get('__setitem__')
+        if isinstance(stub, Stub):
+            return stub(key, value)
         raise UnexpectedCall(
             call=self._name + '.__setitem__', args=(key, value))
 
     def __delitem__(self, key):
-        if isinstance(getattr(self, '__delitem__'), Stub):
-            return getattr(self, '__delitem__')(key)
+        stub = self.__dict__.get('__delitem__')
+        if isinstance(stub, Stub):
+            return stub(key)
         raise UnexpectedCall(call=self._name + '.__delitem__', args=(key,))
 
     def __iter__(self):
-        if isinstance(getattr(self, '__iter__'), Stub):
-            return getattr(self, '__iter__')()
+        stub = self.__dict__.get('__iter__')
+        if isinstance(stub, Stub):
+            return stub()
         raise UnexpectedCall(call=self._name + '.__iter__')
 
     def __reversed__(self):
-        if isinstance(getattr(self, '__reversed__'), Stub):
-            return getattr(self, '__reversed__')()
+        stub = self.__dict__.get('__reversed__')
+        if isinstance(stub, Stub):
+            return stub()
         raise UnexpectedCall(call=self._name + '.__reversed__')
 
     def __contains__(self, item):
-        if isinstance(getattr(self, '__contains__'), Stub):
-            return getattr(self, '__contains__')(item)
+        stub = self.__dict__.get('__contains__')
+        if isinstance(stub, Stub):
+            return stub(item)
         raise UnexpectedCall(call=self._name + '.__contains__', args=(item,))
 
     ###
@@ -98,13 +125,15 @@ class Mock(object):
     # http://docs.python.org/reference/datamodel.html#with-statement-context-managers
     ###
     def __enter__(self):
-        if isinstance(getattr(self, '__enter__'), Stub):
-            return getattr(self, '__enter__')()
+        stub = self.__dict__.get('__enter__')
+        if isinstance(stub, Stub):
+            return stub()
         raise UnexpectedCall(call=self._name + '.__enter__')
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if isinstance(getattr(self, '__exit__'), Stub):
-            return getattr(self, '__exit__')(exc_type, exc_value, traceback)
+        stub = self.__dict__.get('__exit__')
+        if isinstance(stub, Stub):
+            return stub(exc_type, exc_value, traceback)
         raise UnexpectedCall(
             call=self._name + '.__exit__',
             args=(exc_type, exc_value, traceback))
@@ -0,0 +1,95 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+A pytest plugin which provides a chai fixture, for tests that aren't written
+as Chai classes
+
+    def test_get(chai):
+        chai.expect(requests, 'get').args(chai.matches('^http')).returns(200)
+        assert fetch('http://example.com') == 200
+
+The fixture has stub, expect, spy, mock, clock and the comparators of a Chai
+test. Unmet expectations fail the test and every stub and mock is undone
+after it, just as they are for Chai tests, but nothing is loaded into the
+test's module. Coroutine test functions are run on an event loop, as they
+are for Chai tests. The plugin keeps no state of its own outside of the
+fixture, so it works the same in each pytest-xdist worker.
+'''
+from __future__ import absolute_import
+
+import inspect
+import functools
+
+import pytest
+
+from .chai import ChaiMixin
+from .exception import UnexpectedCall, ExpectationNotSatisfied
+from .expectation import _async
+
+
+class ChaiFixture(ChaiMixin):
+
+    '''
+    The value of the chai fixture.
+    '''
+
+    def __init__(self, test_id=None):
+        self._setup_chai()
+        self._id = test_id
+
+    def _test_id(self):
+        return self._id or super(ChaiFixture, self)._test_id()
+
+
+@pytest.fixture
+def chai(request):
+    '''
+    Stub, expect, spy and mock in a test. Unmet expectations fail the test.
+    '''
+    fixture = ChaiFixture(request.node.nodeid)
+    try:
+        yield fixture
+    finally:
+        fixture._teardown_chai()
+
+
+def _verified(func, fixture):
+    '''
+    Wrap a test function to run it as ChaiTestType.test_wrapper runs a test
+    method, failing it if any expectation was unmet.
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        __tracebackhide__ = True
+        try:
+            rval = func(*args, **kwargs)
+            # Coroutine test functions
+            if _async is not None and inspect.isawaitable(rval):
+                fixture._run_coroutine(rval)
+        except UnexpectedCall as e:
+            raise AssertionError('\n\n' + str(e))
+        finally:
+            # Tear down the stubs right away, so that whatever pytest does
+            # to report the outcome uses the original methods.
+            exceptions = fixture._verify_chai()
+
+        if exceptions:
+            raise ExpectationNotSatisfied(*exceptions)
+    return wrapper
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_pyfunc_call(pyfuncitem):
+    fixture = getattr(pyfuncitem, 'funcargs', {}).get('chai')
+    if not isinstance(fixture, ChaiFixture):
+        yield
+        return
+
+    func = pyfuncitem.obj
+    pyfuncitem.obj = _verified(func, fixture)
+    try:
+        yield
+    finally:
+        pyfuncitem.obj = func
@@ -0,0 +1,90 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+The records a test keeps of what it has to undo once it has run.
+'''
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+
+class Registry(object):
+
+    '''
+    The stubs of a test, in the order they were made. Each is held once, by
+    identity, so adding and checking for a stub take constant time however
+    many the test has. The registry remembers which stubs it has already
+    torn down, so each is only torn down once.
+    '''
+
+    def __init__(self, items=()):
+        self._items = OrderedDict()
+        self._restored = set()
+        for item in items:
+            self.add(item)
+
+    def _key(self, item):
+        return id(item)
+
+    def _undo(self, item):
+        item.teardown()
+
+    def add(self, item):
+        '''
+        Add an item unless it's already held. Returns whether it was added.
+        '''
+        key = self._key(item)
+        if key in self._items:
+            return False
+        self._items[key] = item
+        return True
+
+    def __contains__(self, item):
+        return self._key(item) in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+    def restore(self, item):
+        '''
+        Undo an item, unless that's already been done.
+        '''
+        key = self._key(item)
+        if key not in self._restored:
+            self._restored.add(key)
+            self._undo(item)
+
+    def restore_all(self):
+        '''
+        Undo every item that hasn't been already, in the order they were
+        added, and forget them all.
+        '''
+        for key, item in list(self._items.items()):
+            if key not in self._restored:
+                self._restored.add(key)
+                self._undo(item)
+        self._items.clear()
+        self._restored.clear()
+
+
+class MockRegistry(Registry):
+
+    '''
+    The attributes replaced by mocks in a test, as (obj, attr, orig), or
+    (obj, attr) if obj didn't have the attribute. Only the first mock of an
+    attribute is held, as that's the one that knows the original.
+    '''
+
+    def _key(self, item):
+        return (id(item[0]), item[1])
+
+    def _undo(self, item):
+        if len(item) == 2:
+            delattr(item[0], item[1])
+        else:
+            setattr(item[0], item[1], item[2])
@@ -0,0 +1,304 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Run test classes in parallel on a pool of processes
+
+    python -m chai run tests -j 32
+
+Each test class runs in one worker, which afterwards checks that the class
+left nothing of chai behind: stubs which weren't torn down, StubNew stubs
+left in StubNew._cache and values left in Variable._cache. Leaks are cleaned
+up and reported against the class, so that they don't spill into the next
+class to run in the same worker. The results of every worker, including the
+unmet expectations of failed tests, are gathered into a single report.
+'''
+from __future__ import absolute_import, print_function
+
+import gc
+import os
+import sys
+import time
+import unittest
+import importlib
+import multiprocessing
+from collections import namedtuple
+
+from .comparators import Variable
+from .mock import Mock
+from .stub import Stub, StubNew
+from . import stats
+
+
+class ClassResult(namedtuple('ClassResult',
+                             'name tests failures errors skipped leaks '
+                             'seconds')):
+
+    '''
+    The outcome of running one test class. failures and errors are lists of
+    (test id, traceback) and leaks a list of (test id, description), where
+    the test id is the class name for leaks found once the class has run.
+    '''
+
+    __slots__ = ()
+
+
+class _Result(unittest.TestResult):
+
+    '''
+    Keeps failures as text so they can be sent back from a worker, and
+    checks the global state of chai after each test.
+    '''
+
+    def __init__(self):
+        super(_Result, self).__init__()
+        self.leaks = []
+
+    def stopTest(self, test):
+        super(_Result, self).stopTest(test)
+        self.leaks.extend((test.id(), leak) for leak in find_leaks())
+
+    def addError(self, test, err):
+        self.errors.append((test.id(), self._exc_info_to_string(err, test)))
+
+    def addFailure(self, test, err):
+        self.failures.append((test.id(), self._exc_info_to_string(err, test)))
+
+    def addUnexpectedSuccess(self, test):
+        self.failures.append((test.id(), 'Unexpected success'))
+
+
+def find_leaks(stubs=False):
+    '''
+    Return a description of everything chai is holding on to outside of a
+    test, and clean it up. Finding stubs which weren't torn down needs a walk
+    of the heap, so it's only done if stubs is True.
+    '''
+    leaks = []
+    for klass, ref in list(StubNew._cache.items()):
+        stub = ref()
+        if stub is not None:
+            leaks.append('StubNew._cache holds the stub of %s' % (
+                stub.describe(),))
+            stub.teardown()
+    StubNew._cache.clear()
+
+    if Variable._cache:
+        leaks.append('Variable._cache holds %s' % (
+            ', '.join(sorted(Variable._cache)),))
+        Variable._cache.clear()
+
+    if stubs:
+        # Stubs on objects which are garbage can't leak
+        gc.collect()
+        for obj in gc.get_objects():
+            # Stubs of mocks only live as long as the mock
+            if isinstance(obj, Stub) and not obj._torn and \
+                    not isinstance(obj._obj, Mock):
+                leaks.append('%s was not torn down' % (obj.describe(),))
+                obj.teardown()
+    return leaks
+
+
+def discover(names, pattern='*test*.py', top_level_dir=None):
+    '''
+    Find the test classes in directories, files and dotted names. Returns a
+    list of (module name, class name) in the order they were found. Tests
+    that a worker couldn't load by name, such as those standing in for a
+    module which failed to import, are returned as they are and run in this
+    process.
+    '''
+    loader = unittest.TestLoader()
+    suites = []
+    for name in names:
+        if os.path.isdir(name):
+            suites.append(loader.discover(name, pattern, top_level_dir))
+        elif os.path.isfile(name):
+            suites.append(loader.discover(
+                os.path.dirname(name) or '.', os.path.basename(name),
+                top_level_dir))
+        else:
+            suites.append(loader.loadTestsFromName(name))
+
+    rval = []
+    seen = set()
+    for test in _flatten(suites):
+        klass = type(test)
+        module = sys.modules.get(klass.__module__)
+        if getattr(module, klass.__name__, None) is not klass:
+            rval.append(test)
+            continue
+        unit = (klass.__module__, klass.__name__)
+        if unit not in seen:
+            seen.add(unit)
+            rval.append(unit)
+    return rval
+
+
+def _flatten(suites):
+    for suite in suites:
+        if isinstance(suite, unittest.TestSuite):
+            for test in _flatten(suite):
+                yield test
+        else:
+            yield suite
+
+
+def run_class(unit):
+    '''
+    Run one test class, given as (module name, class name), and check for
+    leaks. Returns a ClassResult.
+    '''
+    name = '%s.%s' % unit
+    try:
+        klass = getattr(importlib.import_module(unit[0]), unit[1])
+        suite = unittest.TestLoader().loadTestsFromTestCase(klass)
+    except Exception:
+        result = _Result()
+        result.addError(_Unit(name), sys.exc_info())
+        return ClassResult(name, 0, [], result.errors, 0, [], 0.0)
+    return _run_suite(name, suite)
+
+
+def _run_suite(name, suite):
+    result = _Result()
+    start = time.time()
+    suite.run(result)
+    leaks = result.leaks
+    leaks.extend((name, leak) for leak in find_leaks(stubs=True))
+    return ClassResult(name, result.testsRun, result.failures, result.errors,
+                       len(result.skipped), leaks, time.time() - start)
+
+
+class _Unit(unittest.TestCase):
+
+    '''
+    Stands in for a test class which couldn't be loaded.
+    '''
+
+    def __init__(self, name):
+        super(_Unit, self).__init__('run')
+        self._name = name
+
+    def id(self):
+        return self._name
+
+
+def _init_worker(path):
+    sys.path[:] = path
+    # Forked workers start with the reports of the parent
+    stats._reports.clear()
+
+
+def _run_in_worker(unit):
+    result = run_class(unit)
+    # Pool workers exit without running atexit
+    stats.flush()
+    return result
+
+
+class Report(object):
+
+    '''
+    The results of every class that was run.
+    '''
+
+    def __init__(self):
+        self.results = []
+        self.seconds = 0.0
+
+    def add(self, result):
+        self.results.append(result)
+
+    @property
+    def tests(self):
+        return sum(r.tests for r in self.results)
+
+    @property
+    def failures(self):
+        return [f for r in self.results for f in r.failures]
+
+    @property
+    def errors(self):
+        return [e for r in self.results for e in r.errors]
+
+    @property
+    def leaks(self):
+        return [l for r in self.results for l in r.leaks]
+
+    @property
+    def skipped(self):
+        return sum(r.skipped for r in self.results)
+
+    def successful(self):
+        return not (self.failures or self.errors or self.leaks)
+
+    def write(self, out):
+        '''
+        Write out the failures, errors and leaks, and a summary, in the style
+        of unittest.
+        '''
+        sep1 = '=' * 70
+        sep2 = '-' * 70
+        for kind, entries in (('ERROR', self.errors),
+                              ('FAIL', self.failures)):
+            for test_id, text in entries:
+                print(sep1, file=out)
+                print('%s: %s' % (kind, test_id), file=out)
+                print(sep2, file=out)
+                print(text, file=out)
+        for test_id, leak in self.leaks:
+            print(sep1, file=out)
+            print('LEAK: %s' % test_id, file=out)
+            print(sep2, file=out)
+            print(leak, file=out)
+            print(file=out)
+
+        print(sep2, file=out)
+        print('Ran %d tests in %d classes in %.3fs' % (
+            self.tests, len(self.results), self.seconds), file=out)
+        print(file=out)
+        counts = [('failures', len(self.failures)),
+                  ('errors', len(self.errors)),
+                  ('leaks', len(self.leaks)),
+                  ('skipped', self.skipped)]
+        details = ', '.join('%s=%d' % c for c in counts if c[1])
+        status = 'OK' if self.successful() else 'FAILED'
+        print('%s (%s)' % (status, details) if details else status, file=out)
+
+
+def run(units, processes=None, progress=None):
+    '''
+    Run the test classes found by discover on a pool of processes, or all
+    in this process if processes is 1. progress is called with each
+    ClassResult as it arrives. Returns a Report.
+    '''
+    report = Report()
+    start = time.time()
+
+    def add(result):
+        report.add(result)
+        if progress:
+            progress(result)
+
+    classes = [u for u in units if isinstance(u, tuple)]
+    for test in units:
+        if not isinstance(test, tuple):
+            add(_run_suite(test.id(), unittest.TestSuite([test])))
+
+    if processes == 1:
+        for unit in classes:
+            add(run_class(unit))
+    else:
+        pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(list(sys.path),))
+        try:
+            for result in pool.imap_unordered(_run_in_worker, classes):
+                add(result)
+        finally:
+            pool.close()
+            pool.join()
+
+    report.seconds = time.time() - start
+    return report
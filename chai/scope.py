@@ -0,0 +1,94 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+State that belongs to a single test, such as the values captured by
+Variable and the stubs made by StubNew. Chai makes a new Scope for each
+test, which is current from setUp through tearDown. The current scope is
+kept in a context variable where they're supported, so that tests running
+concurrently in threads or tasks don't share state, and per thread
+otherwise. Outside of any scope the process-wide defaults are used.
+'''
+from __future__ import absolute_import
+
+import weakref
+
+try:
+    import contextvars
+except ImportError:
+    contextvars = None
+
+if contextvars is not None:
+    _current = contextvars.ContextVar('chai_scope', default=None)
+
+    def current():
+        '''
+        Return the current Scope, or None.
+        '''
+        return _current.get()
+
+    def _set(scope):
+        _current.set(scope)
+else:
+    import threading
+    _local = threading.local()
+
+    def current():
+        '''
+        Return the current Scope, or None.
+        '''
+        return getattr(_local, 'scope', None)
+
+    def _set(scope):
+        _local.scope = scope
+
+
+class Scope(object):
+
+    '''
+    The state of one test. Can be used as a context manager, and entered
+    more than once, in which case it's released when the outermost use
+    exits.
+    '''
+
+    def __init__(self):
+        self.variables = {}
+        # The StubNew for each class, see StubNew._cache
+        self.stub_news = weakref.WeakKeyDictionary()
+        self._previous = []
+
+    def enter(self):
+        '''
+        Make this the current scope.
+        '''
+        self._previous.append(current())
+        _set(self)
+        return self
+
+    def exit(self):
+        '''
+        Restore the scope which was current before. Once the outermost use
+        exits, release everything held by this scope.
+        '''
+        _set(self._previous.pop())
+        if not self._previous:
+            self.release()
+
+    def release(self):
+        '''
+        Drop everything held by this scope, and tear down any StubNew that
+        wasn't.
+        '''
+        self.variables.clear()
+        for ref in list(self.stub_news.values()):
+            stub = ref()
+            if stub is not None:
+                stub.teardown()
+        self.stub_news.clear()
+
+    def __enter__(self):
+        return self.enter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.exit()
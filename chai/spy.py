@@ -4,9 +4,15 @@ Copyright (c) 2011-2013, Agora Games, LLC All rights reserved.
 
 https://github.com/agoragames/chai/blob/master/LICENSE.txt
 '''
+from bisect import bisect_left
+from timeit import default_timer
 
 from .exception import UnsupportedModifier
-from .expectation import Expectation
+from .expectation import Expectation, _async
+
+# The upper bounds in seconds of the buckets in the latency histogram of a
+# spy, ten to a decade from 1us to 100s. Slower calls go in one more bucket.
+LATENCY_BUCKETS = tuple(10 ** (e / 10.0) for e in range(-60, 21))
 
 
 class Spy(Expectation):
@@ -21,24 +27,178 @@ class Spy(Expectation):
         self._spy_side_effect_kwargs = None
         self._spy_return = False
 
+        self._latency_count = 0
+        self._latency_total = 0.0
+        self._latency_min = 0.0
+        self._latency_max = 0.0
+        self._histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        # (percentile, seconds) from percentile_under
+        self._latency_limits = []
+
     def _call_spy(self, *args, **kwargs):
-      '''
-      Wrapper to call the spied-on function. Operates similar to
-      Expectation.test.
-      '''
-      if self._spy_side_effect:
-          if self._spy_side_effect_args or self._spy_side_effect_kwargs:
-              self._spy_side_effect(
-                  *self._spy_side_effect_args,
-                  **self._spy_side_effect_kwargs)
-          else:
-              self._spy_side_effect(*args, **kwargs)
-
-      return_value = self._stub.call_orig(*args, **kwargs)
-      if self._spy_return:
-          self._spy_return(return_value)
-
-      return return_value
+        '''
+        Wrapper to call the spied-on function. Operates similar to
+        Expectation.test. If the stub is on a coroutine function, returns a
+        coroutine which awaits the original.
+        '''
+        if self._stub._async:
+            return _async.call_spy(self, args, kwargs)
+
+        self._run_spy_side_effect(args, kwargs)
+
+        start = default_timer()
+        try:
+            return_value = self._stub.call_orig(*args, **kwargs)
+        finally:
+            self._record_latency(default_timer() - start)
+
+        if self._spy_return:
+            self._spy_return(return_value)
+
+        return return_value
+
+    def _run_spy_side_effect(self, args, kwargs):
+        if self._spy_side_effect:
+            if self._spy_side_effect_args or self._spy_side_effect_kwargs:
+                return self._spy_side_effect(
+                    *self._spy_side_effect_args,
+                    **self._spy_side_effect_kwargs)
+            else:
+                return self._spy_side_effect(*args, **kwargs)
+
+    def _record_latency(self, seconds):
+        '''
+        Record how long a call to the spied-on function took.
+        '''
+        self._latency_count += 1
+        self._latency_total += seconds
+        if seconds > self._latency_max:
+            self._latency_max = seconds
+        if seconds < self._latency_min or self._latency_count == 1:
+            self._latency_min = seconds
+        self._histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        stats = self._stub._stats
+        if stats is not None:
+            stats.add_orig(seconds)
+
+    @property
+    def mean_latency(self):
+        '''
+        The mean time in seconds that the spied-on function took, or None if
+        it hasn't been called.
+        '''
+        if self._latency_count:
+            return self._latency_total / self._latency_count
+        return None
+
+    @property
+    def min_latency(self):
+        '''
+        The shortest time in seconds that the spied-on function took, or None
+        if it hasn't been called.
+        '''
+        if self._latency_count:
+            return self._latency_min
+        return None
+
+    @property
+    def max_latency(self):
+        '''
+        The longest time in seconds that the spied-on function took, or None
+        if it hasn't been called.
+        '''
+        if self._latency_count:
+            return self._latency_max
+        return None
+
+    @property
+    def histogram(self):
+        '''
+        The latency histogram, as a list of (upper bound in seconds, calls)
+        for every bucket. The bound of the last bucket is infinite.
+        '''
+        return list(zip(LATENCY_BUCKETS + (float('inf'),), self._histogram))
+
+    def percentile(self, percentile):
+        '''
+        Estimate from the histogram the time in seconds that percentile
+        percent of the calls to the spied-on function took no longer than,
+        or None if it hasn't been called. This is the upper bound of the
+        bucket the percentile falls in, or the longest call if that's less,
+        so it errs on the slow side by at most one bucket. The 100th
+        percentile is the longest call.
+        '''
+        if not self._latency_count:
+            return None
+        rank = self._latency_count * percentile / 100.0
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self._histogram):
+            seen += count
+            if seen >= rank:
+                return min(bound, self._latency_max)
+        return self._latency_max
+
+    def percentile_under(self, percentile, ms):
+        '''
+        Expect percentile percent of the calls to the spied-on function to
+        take less than ms milliseconds, as estimated by percentile(). This is
+        checked along with the counts once the test has run.
+        '''
+        self._latency_limits.append((percentile, ms / 1000.0))
+        return self
+
+    def p99_under(self, ms):
+        '''
+        Expect 99% of the calls to the spied-on function to take less than ms
+        milliseconds.
+        '''
+        return self.percentile_under(99, ms)
+
+    def max_under(self, ms):
+        '''
+        Expect every call to the spied-on function to take less than ms
+        milliseconds.
+        '''
+        return self.percentile_under(100, ms)
+
+    def latency_met(self):
+        '''
+        Whether the calls so far are within the limits of percentile_under.
+        '''
+        for percentile, limit in self._latency_limits:
+            value = self.percentile(percentile)
+            if value is not None and value >= limit:
+                return False
+        return True
+
+    def closed(self, with_counts=False):
+        if with_counts and not self.latency_met():
+            return False
+        return super(Spy, self).closed(with_counts)
+
+    def __str__(self):
+        rval = super(Spy, self).__str__()
+        for percentile, limit in self._latency_limits:
+            value = self.percentile(percentile)
+            rval += "\n\t\t %s: %s, Under: %.3fms" % (
+                'Max' if percentile >= 100 else 'p%g' % percentile,
+                'none' if value is None else '%.3fms' % (value * 1000),
+                limit * 1000)
+        return rval
+
+    def stats(self):
+        '''
+        The number of calls to the spied-on function, the total seconds they
+        took, and the min, mean and max seconds or None if it hasn't been
+        called.
+        '''
+        return {
+            'calls': self._latency_count,
+            'seconds': self._latency_total,
+            'min': self.min_latency,
+            'mean': self.mean_latency,
+            'max': self.max_latency,
+        }
 
     def side_effect(self, func, *args, **kwargs):
         '''
@@ -67,3 +227,15 @@ class Spy(Expectation):
         Disable raises for spies.
         '''
         raise UnsupportedModifier("Can't use raises on spies")
+
+    def returns_after(self, *args):
+        '''
+        Disable returns_after for spies.
+        '''
+        raise UnsupportedModifier("Can't use returns_after on spies")
+
+    def raises_after(self, *args):
+        '''
+        Disable raises_after for spies.
+        '''
+        raise UnsupportedModifier("Can't use raises_after on spies")
@@ -0,0 +1,133 @@
+'''
+Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
+
+https://github.com/agoragames/chai/blob/master/LICENSE.txt
+
+Reports of the stats collected by stubs, see Stub.collect_stats. Chai
+builds a report for each test which has stubs collecting stats, and can
+write the reports of every test to a file as JSON or in the Prometheus text
+format. Workers of pytest-xdist and of process pools, such as those of
+python -m chai run, each write their own file.
+'''
+from __future__ import absolute_import
+
+import os
+import json
+import atexit
+import multiprocessing
+
+# The metrics written in the Prometheus format, with their stat, type and
+# help text.
+METRICS = (
+    ('chai_stub_calls_total', 'calls', 'counter',
+     'Calls to the stub.'),
+    ('chai_stub_unmatched_calls_total', 'unmatched', 'counter',
+     'Calls to the stub which no expectation matched.'),
+    ('chai_stub_dispatch_seconds_total', 'dispatch_seconds', 'counter',
+     'Time spent matching calls to expectations.'),
+    ('chai_stub_orig_calls_total', 'orig_calls', 'counter',
+     'Calls by spies to the original.'),
+    ('chai_stub_orig_seconds_total', 'orig_seconds', 'counter',
+     'Time spent in the original.'),
+    ('chai_stub_orig_min_seconds', 'orig_min', 'gauge',
+     'Shortest call to the original.'),
+    ('chai_stub_orig_mean_seconds', 'orig_mean', 'gauge',
+     'Mean call to the original.'),
+    ('chai_stub_orig_max_seconds', 'orig_max', 'gauge',
+     'Longest call to the original.'),
+)
+
+FORMATS = ('json', 'prometheus')
+
+# The reports to write, by (path, format).
+_reports = {}
+
+
+def report(test, stubs):
+    '''
+    Return the report of a test, given its id and stubs, or None if none of
+    the stubs collected stats.
+    '''
+    collected = [s.stats() for s in stubs
+                 if getattr(s, '_stats', None) is not None]
+    if not collected:
+        return None
+    return {'test': test, 'stubs': collected}
+
+
+def to_json(reports):
+    return json.dumps(reports, indent=2, sort_keys=True)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').\
+        replace('\n', '\\n')
+
+
+def to_prometheus(reports):
+    lines = []
+    for metric, stat, metric_type, help_text in METRICS:
+        lines.append('# HELP %s %s' % (metric, help_text))
+        lines.append('# TYPE %s %s' % (metric, metric_type))
+        for rpt in reports:
+            for stats in rpt['stubs']:
+                value = stats[stat]
+                if value is None:
+                    continue
+                lines.append('%s{test="%s",stub="%s"} %r' % (
+                    metric, _label(rpt['test']), _label(stats['name']),
+                    value))
+    return '\n'.join(lines) + '\n'
+
+
+def dump(reports, path, format='json'):
+    '''
+    Write reports to a file as JSON or in the Prometheus text format.
+    '''
+    if format == 'json':
+        text = to_json(reports)
+    elif format == 'prometheus':
+        text = to_prometheus(reports)
+    else:
+        raise ValueError('unknown stats format %r, use one of %s' % (
+            format, ', '.join(FORMATS)))
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def add(rpt, path, format='json'):
+    '''
+    Add a report to those which flush() writes to path.
+    '''
+    if format not in FORMATS:
+        raise ValueError('unknown stats format %r, use one of %s' % (
+            format, ', '.join(FORMATS)))
+    _reports.setdefault((path, format), []).append(rpt)
+
+
+def process_path(path):
+    '''
+    The file this process writes in place of path. A pytest-xdist worker
+    puts its id before the extension, as in soak.gw0.json, and any other
+    child process its pid, so that they don't overwrite each other.
+    '''
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    if worker is None and \
+            multiprocessing.current_process().name != 'MainProcess':
+        worker = str(os.getpid())
+    if worker is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return '%s.%s%s' % (root, worker, ext)
+
+
+def flush():
+    '''
+    Write every file with all of the reports added for it so far, see
+    process_path. Called when the process exits, which workers of process
+    pools don't do, so they have to call it themselves.
+    '''
+    for (path, format), reports in list(_reports.items()):
+        dump(reports, process_path(path), format)
+
+atexit.register(flush)
@@ -3,134 +3,362 @@ Copyright (c) 2011-2017, Agora Games, LLC All rights reserved.
 
 https://github.com/agoragames/chai/blob/master/LICENSE.txt
 '''
+import re
 import inspect
 import types
 import sys
 import gc
+import threading
+import weakref
+from collections import deque, namedtuple, OrderedDict
+from fnmatch import translate
+from functools import partial
+from timeit import default_timer
+
+try:
+    from reprlib import Repr
+except ImportError:
+    from repr import Repr
+
+try:
+    from threading import get_ident as _get_ident
+except ImportError:
+    from thread import get_ident as _get_ident
+
+try:
+    from time import monotonic as _monotonic
+except ImportError:
+    from time import time as _monotonic
 
 from .expectation import Expectation
-from .spy import Spy
+from .spy import Spy, _async
+from .scope import current as _current_scope
 from .exception import *
 from ._termcolor import colored
 
+def _is_coroutine_function(obj):
+    '''
+    Whether calling obj returns a coroutine that the stub should stand in for.
+    '''
+    return _async is not None and inspect.iscoroutinefunction(obj)
+
+
+# Formats arguments for CallRecords which only keep summaries
+_summary_repr = Repr()
+_summary_repr.maxstring = _summary_repr.maxother = 40
+
 # For clarity here and in tests, could make these class or static methods on
 # Stub. Chai base class would hide that.
 
 
-def stub(obj, attr=None):
+def stub(obj, attr=None, *attrs):
     '''
     Stub an object. If attr is not None, will attempt to stub that attribute
     on the object. Only required for modules and other rare cases where we
-    can't determine the binding from the object.
+    can't determine the binding from the object. If more attribute names are
+    given, stubs all of them and returns a tuple of the stubs.
     '''
+    if attrs:
+        return _stub_attrs(obj, (attr,) + attrs)
     if attr:
         return _stub_attr(obj, attr)
     else:
         return _stub_obj(obj)
 
 
-def _stub_attr(obj, attr_name):
+# The stub factories for attributes, keyed by the type of the attribute and
+# then the category of the object it's on, see _attr_category. Each factory
+# is called with (obj, attr_name, attr). A factory of None means the
+# attribute can't be stubbed.
+_attr_factories = weakref.WeakKeyDictionary()
+
+# The stub factories for objects, keyed by type. A factory of None means
+# that the stub can't be chosen by the type alone.
+_obj_factories = weakref.WeakKeyDictionary()
+
+
+# The signature of each function that's been autospecced, as
+# inspect.signature is slow. Functions which can't be weakly referenced,
+# such as builtins, aren't cached.
+_signatures = weakref.WeakKeyDictionary()
+
+
+def _signature(func):
+    try:
+        return _signatures[func]
+    except KeyError:
+        rval = _signatures[func] = inspect.signature(func)
+        return rval
+    except TypeError:
+        return inspect.signature(func)
+
+
+def _attr_category(obj):
+    if inspect.isclass(obj):
+        return 'class'
+    if inspect.ismodule(obj):
+        return 'module'
+    return 'instance'
+
+
+def _stub_attr(obj, attr_name, category=None):
     '''
     Stub an attribute of an object. Will return an existing stub if
     there already is one.
     '''
-    # Annoying circular reference requires importing here. Would like to see
-    # this cleaned up. @AW
-    from .mock import Mock
+    if category is None:
+        category = _attr_category(obj)
 
     # Check to see if this a property, this check is only for when dealing
     # with an instance. getattr will work for classes.
-    is_property = False
-
-    if not inspect.isclass(obj) and not inspect.ismodule(obj):
+    attr = None
+    if category == 'instance':
         # It's possible that the attribute is defined after initialization, and
         # so is not on the class itself.
         attr = getattr(obj.__class__, attr_name, None)
-        if isinstance(attr, property):
-            is_property = True
+        if not isinstance(attr, property):
+            attr = None
 
-    if not is_property:
+    if attr is None:
         attr = getattr(obj, attr_name)
 
-    # Return an existing stub
+    factories = _attr_factories.get(type(attr))
+    if factories is None:
+        factories = _attr_factories.setdefault(type(attr), {})
+    try:
+        factory = factories[category]
+    except KeyError:
+        factory = factories[category] = _attr_factory(category, type(attr))
+
+    if factory is not None:
+        return factory(obj, attr_name, attr)
+    raise UnsupportedStub(
+        "can't stub %s(%s) of %s", attr_name, type(attr), obj)
+
+
+def _stub_attrs(obj, attr_names):
+    '''
+    Stub several attributes of the same object.
+    '''
+    category = _attr_category(obj)
+    return tuple(_stub_attr(obj, name, category) for name in attr_names)
+
+
+def stub_all(obj, include=None, exclude=None):
+    '''
+    Stub every method or function of an object whose name matches one of the
+    glob patterns in include and none of those in exclude. Either can also be
+    a single pattern. All public names are included by default. Names that
+    start with underscores are only matched by patterns starting with at
+    least as many, so '_*' matches '_send' but not '__eq__'.
+    Attributes that can't be stubbed are skipped, and properties and other
+    descriptors are skipped without being read. Returns a StubGroup.
+    '''
+    included = _matcher(_patterns(include, ('*',)), _patterns(exclude, ()))
+    category = _attr_category(obj)
+
+    stubs = OrderedDict()
+    for name in dir(obj):
+        if not included(name):
+            continue
+        if not _is_routine(_getattr_static(obj, name)):
+            continue
+        try:
+            stubs[name] = _stub_attr(obj, name, category)
+        except UnsupportedStub:
+            pass
+    return StubGroup(obj, stubs)
+
+
+# The types of the methods of classes, as they're stored on the class
+_ROUTINE_DESCRIPTORS = (staticmethod, classmethod, type(object.__init__),
+                        type(str.join), type(dict.__dict__['fromkeys']))
+
+
+def _getattr_static(obj, name):
+    '''
+    Look up an attribute without running descriptors such as properties.
+    '''
+    getattr_static = getattr(inspect, 'getattr_static', None)
+    if getattr_static is not None:
+        return getattr_static(obj, name, None)
+
+    # Python 2
+    try:
+        return object.__getattribute__(obj, '__dict__')[name]
+    except (AttributeError, KeyError, TypeError):
+        pass
+    klass = obj if isinstance(obj, type) else type(obj)
+    for base in inspect.getmro(klass):
+        if name in base.__dict__:
+            return base.__dict__[name]
+    return None
+
+
+def _is_routine(attr):
+    '''
+    Whether an attribute, as found by _getattr_static, is a method or
+    function that stub_all should stub.
+    '''
     if isinstance(attr, Stub):
-        return attr
+        # But not the stub of a property
+        return not inspect.isdatadescriptor(attr)
+    return inspect.isfunction(attr) or inspect.isbuiltin(attr) or \
+        inspect.ismethod(attr) or isinstance(attr, _ROUTINE_DESCRIPTORS)
+
+
+def _patterns(patterns, default):
+    if patterns is None:
+        return default
+    if isinstance(patterns, str):
+        return (patterns,)
+    return tuple(patterns)
+
+
+def _matcher(include, exclude):
+    '''
+    Return a function which tests a name against the include and exclude
+    patterns of stub_all.
+    '''
+    include = [(len(p) - len(p.lstrip('_')), re.compile(translate(p)).match)
+               for p in include]
+    exclude = [re.compile(translate(p)).match for p in exclude]
+    most = max([underscores for underscores, match in include] or [0])
+
+    def included(name):
+        # Most names of an object are special methods, and by default none
+        # of the patterns can match them.
+        if not most and name[:1] == '_':
+            return False
+        underscores = len(name) - len(name.lstrip('_'))
+        if underscores > most:
+            return False
+        for least, match in include:
+            if least >= underscores and match(name):
+                break
+        else:
+            return False
+        for match in exclude:
+            if match(name):
+                return False
+        return True
+    return included
+
+
+def _stub_method_attr(obj, attr_name, attr):
+    # Handle differently if unbound because it's an implicit "any instance"
+    if getattr(attr, 'im_self', None) is None:
+        # Handle the python3 case and py2 filter
+        if hasattr(attr, '__self__'):
+            if attr.__self__ is not None:
+                return StubMethod(obj, attr_name)
+        if sys.version_info.major == 2:
+            return StubUnboundMethod(attr)
+    else:
+        return StubMethod(obj, attr_name)
+
+    raise UnsupportedStub(
+        "can't stub %s(%s) of %s", attr_name, type(attr), obj)
+
+
+def _attr_factory(category, attr_type):
+    '''
+    Pick the stub factory for an attribute of a type on an object of a
+    category.
+    '''
+    # Annoying circular reference requires importing here. Would like to see
+    # this cleaned up. @AW
+    from .mock import Mock
+
+    # Return an existing stub
+    if issubclass(attr_type, Stub):
+        return lambda obj, attr_name, attr: attr
 
     # If a Mock object, stub its __call__
-    if isinstance(attr, Mock):
-        return stub(attr.__call__)
+    if issubclass(attr_type, Mock):
+        return lambda obj, attr_name, attr: stub(attr.__call__)
 
-    if isinstance(attr, property):
-        return StubProperty(obj, attr_name)
+    if issubclass(attr_type, property):
+        return lambda obj, attr_name, attr: StubProperty(obj, attr_name)
 
     # Sadly, builtin functions and methods have the same type, so we have to
     # use the same stub class even though it's a bit ugly
-    if inspect.ismodule(obj) and isinstance(attr, (types.FunctionType,
-                                            types.BuiltinFunctionType,
-                                            types.BuiltinMethodType)):
-        return StubFunction(obj, attr_name)
+    if category == 'module' and issubclass(attr_type, (
+            types.FunctionType, types.BuiltinFunctionType,
+            types.BuiltinMethodType)):
+        return lambda obj, attr_name, attr: StubFunction(obj, attr_name)
 
     # In python3 unbound methods are treated as functions with no reference
     # back to the parent class and no im_* fields. We can still make unbound
     # methods work by passing these through to the stub
-    if inspect.isclass(obj) and isinstance(attr, types.FunctionType):
-        return StubUnboundMethod(obj, attr_name)
+    if category == 'class' and issubclass(attr_type, types.FunctionType):
+        return lambda obj, attr_name, attr: StubUnboundMethod(obj, attr_name)
 
     # I thought that types.UnboundMethodType differentiated these cases but
     # apparently not.
-    if isinstance(attr, types.MethodType):
-        # Handle differently if unbound because it's an implicit "any instance"
-        if getattr(attr, 'im_self', None) is None:
-            # Handle the python3 case and py2 filter
-            if hasattr(attr, '__self__'):
-                if attr.__self__ is not None:
-                    return StubMethod(obj, attr_name)
-            if sys.version_info.major == 2:
-                return StubUnboundMethod(attr)
-        else:
-            return StubMethod(obj, attr_name)
+    if issubclass(attr_type, types.MethodType):
+        return _stub_method_attr
 
-    if isinstance(attr, (types.BuiltinFunctionType, types.BuiltinMethodType)):
-        return StubFunction(obj, attr_name)
+    if issubclass(attr_type, (types.BuiltinFunctionType,
+                              types.BuiltinMethodType)):
+        return lambda obj, attr_name, attr: StubFunction(obj, attr_name)
 
     # What an absurd type this is ....
-    if type(attr).__name__ == 'method-wrapper':
-        return StubMethodWrapper(attr)
+    if attr_type.__name__ == 'method-wrapper':
+        return lambda obj, attr_name, attr: StubMethodWrapper(attr)
 
     # This is also slot_descriptor
-    if type(attr).__name__ == 'wrapper_descriptor':
-        return StubWrapperDescriptor(obj, attr_name)
+    if attr_type.__name__ == 'wrapper_descriptor':
+        return lambda obj, attr_name, attr: StubWrapperDescriptor(
+            obj, attr_name)
 
-    raise UnsupportedStub(
-        "can't stub %s(%s) of %s", attr_name, type(attr), obj)
+    return None
 
 
-def _stub_obj(obj):
+def _obj_factory(obj_type):
     '''
-    Stub an object directly.
+    Pick the stub factory for objects of a type, if the type alone decides
+    it.
     '''
-    # Annoying circular reference requires importing here. Would like to see
-    # this cleaned up. @AW
     from .mock import Mock
 
     # Return an existing stub
-    if isinstance(obj, Stub):
-        return obj
+    if issubclass(obj_type, Stub):
+        return lambda obj: obj
 
     # If a Mock object, stub its __call__
-    if isinstance(obj, Mock):
-        return stub(obj.__call__)
+    if issubclass(obj_type, Mock):
+        return lambda obj: stub(obj.__call__)
 
     # If passed-in a type, assume that we're going to stub out the creation.
     # See StubNew for the awesome sauce.
-    # if isinstance(obj, types.TypeType):
-    if hasattr(types, 'TypeType') and isinstance(obj, types.TypeType):
-        return StubNew(obj)
-    elif hasattr(__builtins__, 'type') and \
-            isinstance(obj, __builtins__.type):
-        return StubNew(obj)
-    elif inspect.isclass(obj):
-        return StubNew(obj)
+    if issubclass(obj_type, type) or (
+            hasattr(types, 'ClassType') and
+            issubclass(obj_type, types.ClassType)):
+        return StubNew
+
+    # These aren't in the types library
+    if obj_type.__name__ == 'method-wrapper':
+        return StubMethodWrapper
+
+    # Bound methods in python3. In python2 these may be unbound, which
+    # _stub_obj sorts out.
+    if sys.version_info.major > 2 and issubclass(obj_type, types.MethodType):
+        return StubMethod
+
+    return None
+
+
+def _stub_obj(obj):
+    '''
+    Stub an object directly.
+    '''
+    try:
+        factory = _obj_factories[type(obj)]
+    except KeyError:
+        factory = _obj_factories[type(obj)] = _obj_factory(type(obj))
+    if factory is not None:
+        return factory(obj)
 
     # I thought that types.UnboundMethodType differentiated these cases but
     # apparently not.
@@ -146,10 +374,6 @@ def _stub_obj(obj):
         else:
             return StubMethod(obj)
 
-    # These aren't in the types library
-    if type(obj).__name__ == 'method-wrapper':
-        return StubMethodWrapper(obj)
-
     if type(obj).__name__ == 'wrapper_descriptor':
         raise UnsupportedStub(
             "must call stub(obj,'%s') for slot wrapper on %s",
@@ -163,37 +387,9 @@ def _stub_obj(obj):
         obj = prop.__self__
 
     # Once we've found a property, we have to figure out how to reference
-    # back to the owning class. This is a giant pain and we have to use gc
-    # to find out where it comes from. This code is dense but resolves to
-    # something like this:
-    # >>> gc.get_referrers( foo.x )
-    # [{'__dict__': <attribute '__dict__' of 'foo' objects>,
-    #   'x': <property object at 0x7f68c99a16d8>,
-    #   '__module__': '__main__',
-    #   '__weakref__': <attribute '__weakref__' of 'foo' objects>,
-    #   '__doc__': None}]
+    # back to the owning class.
     if isinstance(obj, property):
-        klass, attr = None, None
-        for ref in gc.get_referrers(obj):
-            if klass and attr:
-                break
-            if isinstance(ref, dict) and ref.get('prop', None) is obj:
-                klass = getattr(
-                    ref.get('__dict__', None), '__objclass__', None)
-                for name, val in getattr(klass, '__dict__', {}).items():
-                    if val is obj:
-                        attr = name
-                        break
-            # In the case of PyPy, we have to check all types that refer to
-            # the property, and see if any of their attrs are the property
-            elif isinstance(ref, type):
-                # Use dir as a means to quickly walk through the class tree
-                for name in dir(ref):
-                    if getattr(ref, name) == obj:
-                        klass = ref
-                        attr = name
-                        break
-
+        klass, attr = _property_owner(obj)
         if klass and attr:
             rval = stub(klass, attr)
             if prop != obj:
@@ -212,12 +408,236 @@ def _stub_obj(obj):
     raise UnsupportedStub("can't stub %s", obj)
 
 
+# Maps the id() of a property to a weak reference to the class that holds it
+# and its attribute name there. Properties can't be weakly referenced, so an
+# entry is only trusted if the class still holds that same property.
+_property_owners = {}
+
+
+def _register_property(klass, attr, prop):
+    key = id(prop)
+
+    def expire(ref):
+        if _property_owners.get(key, (None,))[0] is ref:
+            del _property_owners[key]
+    _property_owners[key] = (weakref.ref(klass, expire), attr)
+
+
+def _owner_from_registry(prop):
+    klass, attr = _property_owners.get(id(prop), (lambda: None, None))
+    klass = klass()
+    if klass is not None and klass.__dict__.get(attr) is prop:
+        return klass, attr
+    return None
+
+
+def _owner_in_class(klass, prop):
+    '''
+    Search a class, its bases and then its subclasses for the property.
+    '''
+    for cls in inspect.getmro(klass):
+        for attr, val in cls.__dict__.items():
+            if val is prop:
+                return cls, attr
+
+    stack = list(type.__subclasses__(klass))
+    while stack:
+        cls = stack.pop()
+        for attr, val in cls.__dict__.items():
+            if val is prop:
+                return cls, attr
+        stack.extend(type.__subclasses__(cls))
+    return None
+
+
+def _owner_from_qualname(prop):
+    '''
+    The accessors of a property are usually defined in the class body, so
+    their qualified names lead to the owning class. Doesn't work for
+    classes defined in a function.
+    '''
+    for func in (prop.fget, prop.fset, prop.fdel):
+        qualname = getattr(func, '__qualname__', None)
+        module = sys.modules.get(getattr(func, '__module__', None))
+        if not qualname or module is None or '<locals>' in qualname:
+            continue
+
+        klass = module
+        for name in qualname.split('.')[:-1]:
+            klass = getattr(klass, name, None)
+        if inspect.isclass(klass):
+            rval = _owner_in_class(klass, prop)
+            if rval:
+                return rval
+    return None
+
+
+def _owner_from_class_tree(prop):
+    '''
+    Walk every class, registering the properties of those defined in the
+    same module as the property's accessors (or all of them if that isn't
+    known) so that later lookups are found in the registry.
+    '''
+    modules = set(getattr(func, '__module__', None)
+                  for func in (prop.fget, prop.fset, prop.fdel)
+                  if func is not None)
+    modules.discard(None)
+
+    stack = [object]
+    seen = set()
+    while stack:
+        cls = stack.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        stack.extend(type.__subclasses__(cls))
+        if modules and cls.__module__ not in modules:
+            continue
+        for attr, val in list(cls.__dict__.items()):
+            if isinstance(val, property):
+                _register_property(cls, attr, val)
+
+    return _owner_from_registry(prop)
+
+
+def _owner_from_referrers(prop):
+    '''
+    Last resort, use gc to find out where the property comes from. This scans
+    the whole heap. This code is dense but resolves to something like this:
+    >>> gc.get_referrers( foo.x )
+    [{'__dict__': <attribute '__dict__' of 'foo' objects>,
+      'x': <property object at 0x7f68c99a16d8>,
+      '__module__': '__main__',
+      '__weakref__': <attribute '__weakref__' of 'foo' objects>,
+      '__doc__': None}]
+    '''
+    klass, attr = None, None
+    for ref in gc.get_referrers(prop):
+        if klass and attr:
+            break
+        if isinstance(ref, dict) and ref.get('prop', None) is prop:
+            klass = getattr(
+                ref.get('__dict__', None), '__objclass__', None)
+            for name, val in getattr(klass, '__dict__', {}).items():
+                if val is prop:
+                    attr = name
+                    break
+        # In the case of PyPy, we have to check all types that refer to
+        # the property, and see if any of their attrs are the property
+        elif isinstance(ref, type):
+            # Use dir as a means to quickly walk through the class tree
+            for name in dir(ref):
+                if getattr(ref, name) == prop:
+                    klass = ref
+                    attr = name
+                    break
+
+    if klass and attr:
+        return klass, attr
+    return None
+
+
+def _property_owner(prop):
+    '''
+    Return the (class, attribute name) holding a property, or (None, None).
+    '''
+    for find in (_owner_from_registry, _owner_from_qualname,
+                 _owner_from_class_tree, _owner_from_referrers):
+        rval = find(prop)
+        if rval:
+            _register_property(rval[0], rval[1], prop)
+            return rval
+    return None, None
+
+
+class CallRecord(namedtuple('CallRecord',
+                            'args kwargs timestamp thread expectation')):
+
+    '''
+    A call to a stub. The timestamp is from a monotonic clock, thread is the
+    identifier of the calling thread and expectation is the one which
+    handled the call, or None if the call was unexpected.
+    '''
+
+    __slots__ = ()
+
+    def __str__(self):
+        return '%s [thread %s]%s' % (
+            pretty_format_args(*self.args, **self.kwargs), self.thread,
+            ' unexpected' if self.expectation is None else '')
+
+
+class CallStats(object):
+
+    '''
+    The counts and timings kept by a stub which collects stats.
+    '''
+
+    __slots__ = ('calls', 'matched', 'dispatch_seconds', 'orig_calls',
+                 'orig_seconds', 'orig_min', 'orig_max')
+
+    def __init__(self):
+        self.calls = 0
+        self.matched = 0
+        self.dispatch_seconds = 0.0
+        self.orig_calls = 0
+        self.orig_seconds = 0.0
+        self.orig_min = None
+        self.orig_max = None
+
+    def add_call(self, matched, seconds):
+        self.calls += 1
+        if matched:
+            self.matched += 1
+        self.dispatch_seconds += seconds
+
+    def add_orig(self, seconds):
+        self.orig_calls += 1
+        self.orig_seconds += seconds
+        if self.orig_min is None or seconds < self.orig_min:
+            self.orig_min = seconds
+        if self.orig_max is None or seconds > self.orig_max:
+            self.orig_max = seconds
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'matched': self.matched,
+            'unmatched': self.calls - self.matched,
+            'dispatch_seconds': self.dispatch_seconds,
+            'orig_calls': self.orig_calls,
+            'orig_seconds': self.orig_seconds,
+            'orig_min': self.orig_min,
+            'orig_mean': self.orig_seconds / self.orig_calls
+            if self.orig_calls else None,
+            'orig_max': self.orig_max,
+        }
+
+
+class _Summary(str):
+
+    '''
+    The short repr of an argument, which formats as itself.
+    '''
+
+    def __repr__(self):
+        return str(self)
+
+
+def _summarize(value):
+    return _Summary(_summary_repr.repr(value))
+
+
 class Stub(object):
 
     '''
     Base class for all stubs.
     '''
 
+    # Once this many expectations have been found closed, and they make up at
+    # least half of the expectations on the stub, they are archived.
+    _compact_after = 256
+
     def __init__(self, obj, attr=None):
         '''
         Setup the structs for expectations
@@ -226,18 +646,40 @@ class Stub(object):
         self._attr = attr
         self._expectations = []
         self._torn = False
+        self._archived = 0
+        self._archived_runs = 0
+        self._journal = None
+        self._summarize = False
+        self._lock = None
+        self._async = False
+        self._spec = None
+        self._spec_positional = None
+        self._stats = None
+        self._budgets = None
+        self._reset_dispatch()
 
     @property
     def name(self):
         return None  # The base class implement this.
 
+    def describe(self):
+        '''
+        The name of the stub, or its type and object if it can't be named.
+        '''
+        try:
+            return self.name
+        except Exception:
+            # Some stubs can only name themselves while they're in place
+            return '%s on %r' % (type(self).__name__, self._obj)
+
     @property
     def expectations(self):
         return self._expectations
 
     def unmet_expectations(self):
         '''
-        Assert that all expectations on the stub have been met.
+        Assert that all expectations on the stub have been met. Archived
+        expectations were closed, and so are always met.
         '''
         unmet = []
         for exp in self._expectations:
@@ -252,6 +694,7 @@ class Stub(object):
         '''
         if not self._torn:
             self._expectations = []
+            self._reset_dispatch()
             self._torn = True
             self._teardown()
 
@@ -276,14 +719,303 @@ class Stub(object):
         self._expectations.append(spy)
         return spy
 
+    def returns_map(self, mapping):
+        '''
+        Register a whole lookup table in one call. Each key in the mapping
+        becomes an any_order expectation for a call with that key as its only
+        argument, returning the mapped value any number of times. Returns a
+        dict of the expectations by key so that their run counts can be
+        inspected or their counts tightened.
+        '''
+        rval = {}
+        for key, value in mapping.items():
+            rval[key] = self.expect().args(key).returns(value).any_order().\
+                at_least(0)
+        return rval
+
+    def thread_safe(self, enabled=True):
+        '''
+        Serialize the matching and counting of calls to this stub so that it
+        can be called from several threads. Side effects, including the
+        calls made by spies, still run concurrently. Returns the stub.
+        '''
+        self._lock = threading.RLock() if enabled else None
+        return self
+
+    def autospec(self, enabled=True):
+        '''
+        Check calls and expectations against the signature of the original.
+        Arguments are normalized as they're bound to the signature, so that
+        an expectation matches a call whether each argument was passed by
+        position or by keyword, and defaults are filled in. Expectations that
+        could never match raise TypeError when they're defined, and calls
+        which the original wouldn't accept raise TypeError as it would.
+        Returns the stub.
+        '''
+        if not enabled:
+            self._spec = None
+            return self
+
+        func, bound = self._spec_target()
+        if func is None or not hasattr(inspect, 'signature'):
+            raise UnsupportedModifier("Can't autospec %s" % self.name)
+        try:
+            spec = _signature(func)
+        except (TypeError, ValueError):
+            raise UnsupportedModifier(
+                "Can't autospec %s, its signature is unknown" % self.name)
+        params = list(spec.parameters.values())
+        if bound:
+            params = params[1:]
+            spec = spec.replace(parameters=params)
+        self._spec = spec
+
+        # Calls with only positional arguments to a function without
+        # keyword-only arguments are the most common, and need no binding
+        # beyond filling in the defaults.
+        self._spec_positional = None
+        Parameter = inspect.Parameter
+        kinds = [param.kind for param in params]
+        if Parameter.KEYWORD_ONLY not in kinds:
+            positional = [param for param in params if param.kind in (
+                Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD)]
+            defaults = [param.default for param in positional
+                        if param.default is not Parameter.empty]
+            self._spec_positional = (
+                len(positional), len(positional) - len(defaults),
+                tuple(defaults), Parameter.VAR_POSITIONAL in kinds)
+
+        # Bring any expectations there already are into line
+        for exp in self._expectations:
+            if not exp._any_args:
+                rule = exp._arguments_rule
+                exp.args(*rule.args, **rule.kwargs)
+        return self
+
+    def _spec_target(self):
+        '''
+        Return the function whose signature calls to this stub follow, and
+        whether its first argument is bound, or (None, False) if that isn't
+        known.
+        '''
+        return None, False
+
+    def _bind(self, args, kwargs, default=None):
+        '''
+        Normalize the arguments of a call or expectation by binding them to
+        the signature of the original. Missing arguments which have defaults
+        are filled in, passed through default if it's given.
+        '''
+        if self._spec_positional is not None and not kwargs:
+            count, required, defaults, var = self._spec_positional
+            if len(args) == count or (var and len(args) > count):
+                return args, {}
+            if required <= len(args) < count:
+                missing = defaults[len(args) - count:]
+                if default is not None:
+                    missing = tuple(default(d) for d in missing)
+                return args + missing, {}
+
+        try:
+            bound = self._spec.bind(*args, **kwargs)
+        except TypeError as e:
+            raise TypeError('%s%s: %s' % (self.name, self._spec, e))
+        arguments = bound.arguments
+        for param in self._spec.parameters.values():
+            if param.name not in arguments and \
+                    param.default is not param.empty:
+                arguments[param.name] = param.default if default is None \
+                    else default(param.default)
+        return bound.args, bound.kwargs
+
+    def record_calls(self, capacity=100, summarize=False):
+        '''
+        Keep a record of the most recent calls to this stub, up to capacity
+        of them, see recorded_calls. If summarize is True, only short reprs of
+        the arguments are kept rather than the arguments themselves. A
+        capacity of 0 stops recording. Returns the stub.
+        '''
+        if capacity:
+            journal = deque(self._journal or (), maxlen=capacity)
+            self._journal = journal
+        else:
+            self._journal = None
+        self._summarize = summarize
+        return self
+
+    def collect_stats(self, enabled=True):
+        '''
+        Count the calls to this stub, how many of them were matched, and time
+        how long chai took to match them and how long spies took to call the
+        original, see stats(). Returns the stub.
+        '''
+        if enabled:
+            if self._stats is None:
+                self._stats = CallStats()
+        else:
+            self._stats = None
+        self._instrument()
+        return self
+
+    def stats(self):
+        '''
+        The statistics collected since collect_stats() was called, as a dict,
+        or None if they aren't being collected. Times are in seconds.
+        '''
+        if self._stats is None:
+            return None
+        rval = self._stats.as_dict()
+        rval['name'] = self.name
+        return rval
+
+    def _instrument(self):
+        '''
+        Route calls through _find_instrumented if the stub collects stats or
+        is charged to a budget. Only those stubs pay for it.
+        '''
+        if self._stats is None and not self._budgets:
+            self.__dict__.pop('_find', None)
+        else:
+            self._find = self._find_instrumented
+
+    def _find_instrumented(self, args, kwargs):
+        if self._budgets:
+            for member in self._budgets:
+                member.calls += 1
+        if self._stats is None:
+            return Stub._find(self, args, kwargs)
+        start = default_timer()
+        exp = Stub._find(self, args, kwargs)
+        self._stats.add_call(exp is not None, default_timer() - start)
+        return exp
+
+    @property
+    def recorded_calls(self):
+        '''
+        The list of recorded calls as CallRecords, oldest first. Empty unless
+        record_calls has been called.
+        '''
+        return list(self._journal or ())
+
+    def _record(self, args, kwargs, exp):
+        if self._summarize:
+            args = tuple(_summarize(a) for a in args)
+            kwargs = dict((k, _summarize(v)) for k, v in kwargs.items())
+        else:
+            kwargs = dict(kwargs)
+        self._journal.append(
+            CallRecord(args, kwargs, _monotonic(), _get_ident(), exp))
+
     def call_orig(self, *args, **kwargs):
         '''
         Calls the original function.
         '''
         raise NotImplementedError("Must be implemented by subclasses")
 
-    def __call__(self, *args, **kwargs):
+    def _reset_dispatch(self):
+        '''
+        Clear the structures used to route calls to expectations. They are
+        rebuilt from self._expectations on the next call.
+        '''
+        self._scan = deque()
+        self._index = {}
+        self._classified = 0
+        self._closed = 0
+        # Marks the expectations filed since, see _reindex
+        self._filing = object()
+
+    def _compact(self):
+        '''
+        Drop closed expectations, keeping only a count of them and of the
+        calls they handled for reporting. Closed expectations can never match
+        again, so this doesn't change how calls are dispatched. Those which
+        are closed but still unmet, such as spies over their latency limits,
+        are kept so that they're reported.
+        '''
+        live = []
         for exp in self._expectations:
+            if exp.closed() and exp.closed(with_counts=True):
+                self._archived += 1
+                self._archived_runs += exp._run_count
+            else:
+                live.append(exp)
+        self._expectations = live
+        self._reset_dispatch()
+
+    def _classify(self):
+        '''
+        File the expectations added since the last call. Those which match
+        on exact, hashable arguments go into the index, the rest have to be
+        walked in order. Each entry keeps its position so that the two can be
+        merged back into the original ordering.
+        '''
+        for pos in range(self._classified, len(self._expectations)):
+            exp = self._expectations[pos]
+            key = None
+            if isinstance(exp, Expectation):
+                key = exp._dispatch_key()
+                exp._filed = self._filing
+            if key is None:
+                self._scan.append((pos, exp))
+            else:
+                self._index.setdefault(key, deque()).append((pos, exp))
+        self._classified = len(self._expectations)
+
+    def _reindex(self, exp):
+        '''
+        Called by an expectation when its arguments or ordering change. If it
+        has already been filed for dispatch, start over on the next call.
+        '''
+        if exp._filed is self._filing:
+            self._reset_dispatch()
+
+    def _lookup(self, args, kwargs):
+        '''
+        Find the first open indexed expectation for these exact arguments.
+        '''
+        try:
+            key = (args, frozenset(kwargs.items()))
+            candidates = self._index.get(key)
+        except TypeError:
+            # Unhashable arguments can only be matched by the scan.
+            return None
+        if candidates is None:
+            return None
+
+        while candidates and candidates[0][1].closed():
+            candidates.popleft()
+            self._closed += 1
+        if candidates:
+            return candidates[0]
+        del self._index[key]
+        return None
+
+    def _find(self, args, kwargs):
+        '''
+        Find the expectation that handles a call, or None if there isn't one.
+        '''
+        if self._closed >= self._compact_after and \
+                self._closed * 2 >= len(self._expectations):
+            self._compact()
+        if self._classified < len(self._expectations):
+            self._classify()
+
+        # Closed expectations at the front of the scan will never match
+        # again, so move the start of the walk past them.
+        scan = self._scan
+        while scan and scan[0][1].closed():
+            scan.popleft()
+            self._closed += 1
+
+        hit = None
+        if self._index:
+            hit = self._lookup(args, kwargs)
+
+        for pos, exp in scan:
+            # An indexed expectation earlier in the list takes priority.
+            if hit is not None and pos > hit[0]:
+                break
+
             # If expectation closed skip
             if exp.closed():
                 continue
@@ -298,19 +1030,61 @@ class Stub(object):
                 if exp.counts_met():
                     exp.close(*args, **kwargs)
                 elif not exp.is_any_order():
+                    hit = None
                     break
             else:
-                return exp.test(*args, **kwargs)
+                return exp
+
+        # The index only finds a candidate, it's validated like any other.
+        if hit is not None and hit[1].match(*args, **kwargs):
+            return hit[1]
+        return None
 
+    def __call__(self, *args, **kwargs):
+        if self._spec is not None:
+            args, kwargs = self._bind(args, kwargs)
+        if self._lock is None:
+            exp = self._find(args, kwargs)
+            if self._journal is not None:
+                self._record(args, kwargs, exp)
+            if exp is not None:
+                if self._async:
+                    # Unexpected calls still raise here, but the result is
+                    # delivered when the call is awaited.
+                    exp._account(True)
+                    return _async.respond(exp, args, kwargs)
+                return exp._test(True, args, kwargs)
+        else:
+            # Only finding and counting the call are serialized, the side
+            # effects and return value are run outside of the lock.
+            with self._lock:
+                exp = self._find(args, kwargs)
+                if exp is not None:
+                    exp._account(True)
+                if self._journal is not None:
+                    self._record(args, kwargs, exp)
+            if exp is not None:
+                if self._async:
+                    return _async.respond(exp, args, kwargs)
+                return exp._respond(True, args, kwargs)
+
+        # Snapshot the expectations as the stub may be torn down before the
+        # exception is displayed.
         raise UnexpectedCall(
-            call=self.name, suffix=self._format_exception(),
-            args=args, kwargs=kwargs)
+            call=self.name,
+            suffix=partial(self._format_exception, list(self._expectations)),
+            args=args, kwargs=kwargs, history=self.recorded_calls)
 
-    def _format_exception(self):
+    def _format_exception(self, expectations=None):
+        if expectations is None:
+            expectations = self._expectations
         result = [
             colored("All expectations", 'white', attrs=['bold'])
         ]
-        for e in self._expectations:
+        if self._archived:
+            result.append("\n\t%d closed expectations archived, Ran: %d" % (
+                self._archived, self._archived_runs))
+        for e in expectations:
             result.append(str(e))
         return "\n".join(result)
 
@@ -388,6 +1162,7 @@ class StubMethod(Stub):
         else:
             self._instance = self._obj
             self._obj = getattr(self._instance, self._attr)
+        self._async = _is_coroutine_function(self._obj)
         setattr(self._instance, self._attr, self)
 
     @property
@@ -419,6 +1194,12 @@ class StubMethod(Stub):
         else:
             return self._obj(*args, **kwargs)
 
+    def _spec_target(self):
+        func = getattr(self._obj, '__func__', None)
+        if func is None:
+            return self._obj, False
+        return func, True
+
     def _teardown(self):
         '''
         Put the original method back in place. This will also handle the
@@ -502,6 +1283,7 @@ class StubFunction(Stub):
             self._was_object_method = \
                 self._attr not in self._instance.__dict__.keys() and\
                 self._attr in object.__dict__.keys()
+        self._async = _is_coroutine_function(self._obj)
         setattr(self._instance, self._attr, self)
 
     @property
@@ -515,6 +1297,9 @@ class StubFunction(Stub):
         # TODO: Does this change if was_object_method?
         return self._obj(*args, **kwargs)
 
+    def _spec_target(self):
+        return self._obj, False
+
     def _teardown(self):
         '''
         Replace the original method.
@@ -532,17 +1317,38 @@ class StubNew(StubFunction):
     and act more like we're stubbing "__init__". Needs to use the logic in
     the StubFunction ctor.
     '''
-    _cache = {}
+    # The stub for each class, used outside of a test. Each test has its own
+    # registry in its chai.scope.Scope. The class and its stub refer to each
+    # other, so both are held weakly so that classes made for a test can be
+    # garbage collected.
+    _cache = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def _current_registry(cls):
+        scope = _current_scope()
+        if scope is None:
+            return cls._cache
+        return scope.stub_news
 
     def __new__(self, klass, *args):
         '''
         Because we're not saving the stub into any attribute, then we have
         to do some faking here to return the same handle.
         '''
-        rval = self._cache.get(klass)
-        if not rval:
-            rval = self._cache[klass] = super(
-                StubNew, self).__new__(self, *args)
+        registry = self._current_registry()
+        ref = registry.get(klass)
+        rval = ref() if ref is not None else None
+        if rval is None:
+            # A stub made in another scope, or outside of one, is still the
+            # stub while it's in place.
+            installed = getattr(klass, '__dict__', {}).get('__new__')
+            if isinstance(installed, StubNew) and not installed._torn and \
+                    installed._type is klass:
+                rval = installed
+        if rval is None:
+            rval = super(StubNew, self).__new__(self, *args)
+            registry[klass] = weakref.ref(rval)
+            rval._registry = registry
             rval._allow_init = True
         else:
             rval._allow_init = False
@@ -573,6 +1379,13 @@ class StubNew(StubFunction):
         rval.__init__(*args, **kwargs)
         return rval
 
+    def _spec_target(self):
+        # inspect.signature would find this stub in place of __new__
+        init = self._type.__init__
+        if init is object.__init__ and self._new is not object.__new__:
+            return self._new, True
+        return init, True
+
     def _teardown(self):
         '''
         Overload so that we can clear out the cache after a test run.
@@ -584,7 +1397,7 @@ class StubNew(StubFunction):
         # StubFunction which then fails to delattr and from then on the class
         # is corrupted. So skip that teardown and use a __new__-specific case.
         setattr(self._instance, self._attr, staticmethod(self._new))
-        StubNew._cache.pop(self._type)
+        self._registry.pop(self._type, None)
 
 
 class StubUnboundMethod(Stub):
@@ -607,6 +1420,14 @@ class StubUnboundMethod(Stub):
         else:
             self._obj = getattr(obj, attr)
             self._instance = obj
+        self._async = _is_coroutine_function(self._obj)
+        # Once the stub is in place the class can't tell any more
+        self._static = False
+        for klass in inspect.getmro(self._instance):
+            if self._attr in klass.__dict__:
+                self._static = isinstance(klass.__dict__[self._attr],
+                                          staticmethod)
+                break
         setattr(self._instance, self._attr, self)
 
     @property
@@ -623,6 +1444,10 @@ class StubUnboundMethod(Stub):
         # side-effect of the actual implementation of spies.
         raise NotImplementedError("unbound method spies are not supported")
 
+    def _spec_target(self):
+        # Called on an instance, but self isn't passed to the stub
+        return self._obj, not self._static
+
     def _teardown(self):
         '''
         Replace the original method.
@@ -655,6 +1480,9 @@ class StubMethodWrapper(Stub):
         '''
         return self._obj(*args, **kwargs)
 
+    def _spec_target(self):
+        return self._obj, False
+
     def _teardown(self):
         '''
         Replace the original method.
@@ -694,3 +1522,40 @@ class StubWrapperDescriptor(Stub):
         Replace the original method.
         '''
         setattr(self._obj, self._attr, self._orig)
+
+
+class StubGroup(object):
+
+    '''
+    The stubs made by stub_all, by attribute name. They can be checked and
+    torn down together.
+    '''
+
+    def __init__(self, obj, stubs):
+        self._obj = obj
+        self.stubs = stubs
+
+    def __getitem__(self, name):
+        return self.stubs[name]
+
+    def __contains__(self, name):
+        return name in self.stubs
+
+    def __len__(self):
+        return len(self.stubs)
+
+    def unmet_expectations(self):
+        '''
+        The unmet expectations of all the stubs.
+        '''
+        unmet = []
+        for s in self.stubs.values():
+            unmet.extend(s.unmet_expectations())
+        return unmet
+
+    def teardown(self):
+        '''
+        Tear down all the stubs.
+        '''
+        for s in self.stubs.values():
+            s.teardown()
@@ -11,13 +11,16 @@ setup(
     version=__version__,
     author='Vitaly Babiy, Aaron Westendorf',
     author_email="vbabiy@agoragames.com, aaron@agoragames.com",
-    packages=['chai'],
+    packages=['chai', 'chai.benchmarks'],
     url='https://github.com/agoragames/chai',
     license='LICENSE.txt',
     description="Easy to use mocking, stubbing and spying framework.",
     long_description=open('README.rst').read(),
     keywords=['python', 'test', 'mock'],
     install_requires=requirements,
+    entry_points={
+        'pytest11': ['chai = chai.pytest_plugin'],
+    },
     classifiers=[
         'Development Status :: 6 - Mature',
         'License :: OSI Approved :: BSD License',
@@ -0,0 +1,81 @@
+"""
+Coroutine functions for the async tests. Kept apart from the tests because
+the syntax needs Python 3.5.
+"""
+import asyncio
+
+
+async def fetch(key):
+  await asyncio.sleep(0)
+  return 'fetched %s' % key
+
+
+class Client(object):
+
+  async def get(self, key):
+    await asyncio.sleep(0)
+    return 'got %s' % key
+
+  async def fail(self):
+    raise ValueError('failed')
+
+
+async def call_twice(func, *args):
+  return [await func(*args), await func(*args)]
+
+
+def recorder(calls, result):
+  async def record(*args):
+    calls.append(args)
+    return result
+  return record
+
+
+async def sleep_for(seconds):
+  await asyncio.sleep(seconds)
+  return seconds
+
+
+async def with_timeout(aw, timeout):
+  try:
+    return await asyncio.wait_for(aw, timeout)
+  except asyncio.TimeoutError:
+    return 'timed out'
+
+
+async def retry(func, attempts, backoff):
+  for attempt in range(attempts):
+    try:
+      return await func()
+    except IOError:
+      await asyncio.sleep(backoff * 2 ** attempt)
+  return 'gave up'
+
+
+async def await_value(aw):
+  return await aw
+
+
+def chai_test_case():
+  # Imported here so that the tests control when the class is created
+  from chai import Chai
+
+  class VirtualLoopCase(Chai):
+    virtual_loop = True
+
+    async def test_sleeps_in_virtual_time(self):
+      loop = asyncio.get_event_loop()
+      self.assertTrue(loop is self.loop)
+      await asyncio.sleep(3600)
+      self.assertEquals(3600, loop.time())
+
+    async def test_delayed_expectation(self):
+      client = Client()
+      expect(client.get).returns_after(10, 'late')
+      self.assertEquals('timed out', await with_timeout(client.get('a'), 5))
+
+    async def test_unmet_expectation(self):
+      client = Client()
+      expect(client.get)
+
+  return VirtualLoopCase
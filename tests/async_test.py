@@ -0,0 +1,92 @@
+import unittest
+
+from chai.stub import stub, StubMethod, StubFunction
+from chai.exception import UnexpectedCall
+
+try:
+  import asyncio
+  from tests import async_samples
+except (ImportError, SyntaxError):
+  async_samples = None
+
+
+def run(coro):
+  loop = asyncio.new_event_loop()
+  try:
+    return loop.run_until_complete(coro)
+  finally:
+    loop.close()
+
+
+@unittest.skipIf(async_samples is None, "coroutines need python 3.5")
+class AsyncStubTest(unittest.TestCase):
+
+  def test_method_returns_awaitable(self):
+    client = async_samples.Client()
+    s = stub(client.get)
+    self.assertTrue(isinstance(s, StubMethod))
+    self.assertTrue(s._async)
+    s.expect().args('a').returns('stubbed')
+    try:
+      coro = client.get('a')
+      self.assertTrue(asyncio.iscoroutine(coro))
+      self.assertEquals('stubbed', run(coro))
+    finally:
+      s.teardown()
+
+  def test_function_raises_when_awaited(self):
+    s = stub(async_samples.fetch)
+    self.assertTrue(isinstance(s, StubFunction))
+    s.expect().raises(KeyError('a'))
+    try:
+      coro = async_samples.fetch('a')
+      self.assertRaises(KeyError, run, coro)
+    finally:
+      s.teardown()
+
+  def test_unexpected_call_raises_at_call_time(self):
+    client = async_samples.Client()
+    s = stub(client, 'get')
+    s.expect().args('a').returns('stubbed')
+    self.assertRaises(UnexpectedCall, client.get, 'b')
+
+  def test_side_effect_coroutines_are_awaited(self):
+    client = async_samples.Client()
+    calls = []
+    side_effect = async_samples.recorder(calls, 'from side effect')
+    stub(client.get).expect().side_effect(side_effect).times(2)
+
+    self.assertEquals(['from side effect'] * 2,
+      run(async_samples.call_twice(client.get, 'a')))
+    self.assertEquals([('a',), ('a',)], calls)
+
+  def test_counts_are_kept_before_the_call_is_awaited(self):
+    client = async_samples.Client()
+    s = stub(client.get)
+    exp = s.expect().returns(1).times(1)
+    coro = client.get('a')
+    self.assertEquals(1, exp._run_count)
+    self.assertEquals([], s.unmet_expectations())
+    self.assertEquals(1, run(coro))
+
+  def test_spy_awaits_original_and_records_latency(self):
+    client = async_samples.Client()
+    returned = []
+    spy = stub(client.get).spy().spy_return(returned.append).times(2)
+
+    self.assertEquals(['got a', 'got a'],
+      run(async_samples.call_twice(client.get, 'a')))
+    self.assertEquals(['got a', 'got a'], returned)
+    self.assertEquals(2, spy._latency_count)
+    self.assertTrue(spy.max_latency >= spy.mean_latency >= 0)
+
+  def test_spy_propagates_exceptions(self):
+    client = async_samples.Client()
+    spy = stub(client.fail).spy()
+    self.assertRaises(ValueError, run, client.fail())
+    self.assertEquals(1, spy._latency_count)
+
+  def test_thread_safe_stub(self):
+    client = async_samples.Client()
+    stub(client.get).thread_safe().expect().returns('stubbed')
+    self.assertEquals('stubbed', run(client.get('a')))
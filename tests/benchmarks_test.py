@@ -0,0 +1,41 @@
+import unittest
+
+from chai import benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+
+  def test_measure(self):
+    calls = []
+    self.assertTrue(benchmarks.measure(lambda: calls.append(1), 3, 2) >= 0)
+    self.assertEquals(6, len(calls))
+
+  def test_measure_each_passes_setup_result(self):
+    seen = []
+    benchmarks.measure_each(lambda: 'arg', seen.append, 2, 2)
+    self.assertEquals(['arg'] * 4, seen)
+
+  def test_run_filters_by_pattern(self):
+    results = benchmarks.run(['mocks.attribute_chain'], scale=0.001)
+    self.assertEquals(['mocks.attribute_chain'], list(results['results']))
+    self.assertTrue('python' in results)
+    self.assertTrue('chai' in results)
+
+  def test_thread_stress_counts_every_call(self):
+    from chai.benchmarks import threads
+    result = threads.stress(4, 50, thread_safe=True)
+    self.assertEquals(200, result.calls)
+    self.assertEquals(0, result.lost)
+    self.assertTrue(result.met)
+
+  def test_threshold_for(self):
+    thresholds = [('stubs.*', 0.5), ('stubs.create.*', 1.0)]
+    self.assertEquals(0.25, benchmarks.threshold_for('mocks.x', thresholds, 0.25))
+    self.assertEquals(0.5, benchmarks.threshold_for('stubs.teardown', thresholds, 0.25))
+    self.assertEquals(1.0, benchmarks.threshold_for('stubs.create.x', thresholds, 0.25))
+
+  def test_compare(self):
+    baseline = {'results': {'a': 1.0, 'b': 1.0, 'c': 1.0, 'gone': 1.0}}
+    results = {'results': {'a': 1.2, 'b': 1.3, 'c': 1.6, 'new': 1.0}}
+    regressions = benchmarks.compare(results, baseline, 0.25, [('c', 1.0)])
+    self.assertEquals(['b'], [r[0] for r in regressions])
@@ -0,0 +1,108 @@
+import unittest
+
+from chai import Chai
+from chai.budget import Budget
+from chai.stub import Stub, StubFunction, stub_all
+from chai.exception import ExpectationNotSatisfied, UnexpectedCall
+import tests.samples as samples
+
+
+class BudgetTest(unittest.TestCase):
+
+  def test_counts_calls_across_members(self):
+    query = StubFunction(samples, 'mod_func_1')
+    get = StubFunction(samples, 'mod_func_3')
+    try:
+      query.expect().any_order().at_least(0)
+      spy = get.spy().any_order().at_least(0)
+      b = Budget('queries', 3)
+      self.assertTrue(b is b.attach(query, spy, query))
+
+      samples.mod_func_1()
+      samples.mod_func_3(1)
+      samples.mod_func_1()
+      self.assertEquals(3, b.calls)
+      self.assertEquals([], b.unmet_expectations())
+
+      samples.mod_func_3(1)
+    finally:
+      query.teardown()
+      get.teardown()
+
+    self.assertEquals(4, b.calls)
+    self.assertEquals([('tests.samples.mod_func_1', 2),
+                       ('tests.samples.mod_func_3', 2)], b.breakdown())
+    unmet = b.unmet_expectations()
+    self.assertEquals(1, len(unmet))
+    self.assertTrue(isinstance(unmet[0], ExpectationNotSatisfied))
+    text = str(unmet[0])
+    self.assertTrue('budget queries - Exceeded' in text)
+    self.assertTrue('Calls: 4, Max Calls: 3' in text)
+    self.assertTrue('tests.samples.mod_func_1: 2' in text)
+
+  def test_counts_unexpected_calls(self):
+    s = Stub('query')
+    b = Budget('queries', 0).attach(s)
+    self.assertRaises(UnexpectedCall, s)
+    self.assertEquals(1, b.calls)
+
+  def test_stub_group(self):
+    group = stub_all(samples.SampleBase(), include='add_*')
+    try:
+      b = Budget('adds', 10).attach(group)
+      self.assertEquals(len(group), len(b.breakdown()))
+    finally:
+      group.teardown()
+
+  def test_rejects_other_members(self):
+    self.assertRaises(TypeError, Budget('queries', 1).attach, len)
+
+  def test_teardown_stops_counting(self):
+    s = Stub('query').collect_stats()
+    s.expect().any_order().at_least(0)
+    b = Budget('queries', 1).attach(s)
+    s()
+    b.teardown()
+    s()
+    self.assertEquals(1, b.calls)
+    self.assertEquals(None, s._budgets or None)
+    # Still collecting stats
+    self.assertEquals(2, s.stats()['calls'])
+
+    s.collect_stats(False)
+    self.assertFalse('_find' in s.__dict__)
+
+
+class BudgetChaiTest(unittest.TestCase):
+
+  def test_budget_fails_test(self):
+    class Case(Chai):
+      def test_queries(self):
+        budget('queries', 2,
+               spy(samples.mod_func_3).any_order().at_least(0),
+               spy(samples.mod_func_4).any_order().at_least(0))
+        samples.mod_func_3(1)
+        samples.mod_func_4(1)
+        samples.mod_func_3(2)
+
+    case = Case('test_queries')
+    case.setUp()
+    try:
+      self.assertRaises(ExpectationNotSatisfied, case.test_queries)
+    finally:
+      case.tearDown()
+    self.assertFalse(isinstance(samples.mod_func_3, Stub))
+
+  def test_budget_within_limit(self):
+    class Case(Chai):
+      def test_queries(self):
+        b = self.budget('queries', 2)
+        b.attach(self.spy(samples.mod_func_3).any_order().at_least(0))
+        samples.mod_func_3(1)
+
+    case = Case('test_queries')
+    case.setUp()
+    try:
+      case.test_queries()
+    finally:
+      case.tearDown()
@@ -1,11 +1,13 @@
 
+import sys
+import types
 import unittest
-from collections import deque
 
 from chai import Chai
-from chai.chai import ChaiTestType
+from chai.chai import ChaiTestType, ChaiBase
 from chai.mock import Mock
 from chai.stub import Stub
+from chai.registry import Registry, MockRegistry
 from chai.exception import *
 from chai.comparators import Comparator
 
@@ -59,8 +61,9 @@ class ChaiTest(unittest.TestCase):
   def test_setup(self):
     case = CupOf()
     case.setup()
-    self.assertEquals( deque(), case._stubs )
-    self.assertEquals( deque(), case._mocks )
+    self.addCleanup(case.teardown)
+    self.assertEquals( [], list(case._stubs) )
+    self.assertEquals( [], list(case._mocks) )
 
   def test_teardown_closes_out_stubs_and_mocks(self):
       class Stub(object):
@@ -73,13 +76,46 @@ class ChaiTest(unittest.TestCase):
       
       case = CupOf()
       stub = Stub()
-      case._stubs = deque([stub])
-      case._mocks = deque([(obj,'mock1','fee'), (obj,'mock2')])
+      case._stubs = Registry([stub])
+      case._mocks = MockRegistry([(obj,'mock1','fee'), (obj,'mock2')])
       case.teardown()
       self.assertEquals( 1, stub.calls )
       self.assertEquals( 'fee', obj.mock1 )
       self.assertFalse( hasattr(obj, 'mock2') )
 
+  def test_teardown_restores_once(self):
+    class Stub(object):
+      calls = 0
+      def unmet_expectations(self): return []
+      def teardown(self): self.calls += 1
+
+    case = CupOf()
+    case.setup()
+    self.addCleanup(case.teardown)
+    stub = Stub()
+    case._stubs.add(stub)
+    self.assertFalse( case._stubs.add(stub) )
+    self.assertEquals( [], case._verify_chai() )
+    self.assertEquals( 1, stub.calls )
+    case.teardown()
+    self.assertEquals( 1, stub.calls )
+    self.assertEquals( 0, len(case._stubs) )
+
+  def test_teardown_restores_first_mock(self):
+    obj = type('test',(object,),{})()
+    obj.attr = 'orig'
+
+    case = CupOf()
+    case.setup()
+    self.addCleanup(case.teardown)
+    case.mock( obj, 'attr' )
+    case.mock( obj, 'attr' )
+    case.mock( obj, 'other' )
+    case.mock( obj, 'other' )
+    case.teardown()
+    self.assertEquals( 'orig', obj.attr )
+    self.assertFalse( hasattr(obj, 'other') )
+
   def test_stub(self):
     class Milk(object):
       def pour(self): pass
@@ -87,14 +123,48 @@ class ChaiTest(unittest.TestCase):
     case = CupOf()
     milk = Milk()
     case.setup()
-    self.assertEquals( deque(), case._stubs )
+    self.addCleanup(case.teardown)
+    self.assertEquals( [], list(case._stubs) )
     case.stub( milk.pour )
     self.assertTrue( isinstance(milk.pour, Stub) )
-    self.assertEquals( deque([milk.pour]), case._stubs )
+    self.assertEquals( [milk.pour], list(case._stubs) )
 
     # Test it's only added once
     case.stub( milk, 'pour' )
-    self.assertEquals( deque([milk.pour]), case._stubs )
+    self.assertEquals( [milk.pour], list(case._stubs) )
+
+  def test_stub_several_attributes(self):
+    class Milk(object):
+      def pour(self): pass
+      def spill(self): pass
+
+    case = CupOf()
+    milk = Milk()
+    case.setup()
+    self.addCleanup(case.teardown)
+    pour, spill = case.stub( milk, 'pour', 'spill' )
+    self.assertTrue( pour is milk.pour )
+    self.assertTrue( spill is milk.spill )
+    self.assertEquals( [pour, spill], list(case._stubs) )
+
+    case.stub( milk, 'spill', 'pour' )
+    self.assertEquals( [pour, spill], list(case._stubs) )
+
+  def test_stub_all(self):
+    class Milk(object):
+      def pour(self): pass
+      def spill(self): pass
+
+    case = CupOf()
+    milk = Milk()
+    case.setup()
+    self.addCleanup(case.teardown)
+    group = case.stub_all( milk, exclude='spill' )
+    self.assertEquals( ['pour'], list(group.stubs) )
+    self.assertEquals( [group], list(case._stubs) )
+    case.expect( milk.pour )
+    case.teardown()
+    self.assertFalse( isinstance(milk.pour, Stub) )
 
   def test_expect(self):
     class Milk(object):
@@ -103,27 +173,29 @@ class ChaiTest(unittest.TestCase):
     case = CupOf()
     milk = Milk()
     case.setup()
-    self.assertEquals( deque(), case._stubs )
+    self.addCleanup(case.teardown)
+    self.assertEquals( [], list(case._stubs) )
     case.expect( milk.pour )
-    self.assertEquals( deque([milk.pour]), case._stubs )
+    self.assertEquals( [milk.pour], list(case._stubs) )
 
     # Test it's only added once
     case.expect( milk, 'pour' )
-    self.assertEquals( deque([milk.pour]), case._stubs )
+    self.assertEquals( [milk.pour], list(case._stubs) )
 
     self.assertEquals( 2, len(milk.pour._expectations) )
 
   def test_mock_no_binding(self):
     case = CupOf()
     case.setup()
+    self.addCleanup(case.teardown)
 
-    self.assertEquals( deque(), case._mocks )
+    self.assertEquals( [], list(case._mocks) )
     mock1 = case.mock()
     self.assertTrue( isinstance(mock1, Mock) )
-    self.assertEquals( deque(), case._mocks )
+    self.assertEquals( [], list(case._mocks) )
     mock2 = case.mock()
     self.assertTrue( isinstance(mock2, Mock) )
-    self.assertEquals( deque(), case._mocks )
+    self.assertEquals( [], list(case._mocks) )
     self.assertNotEqual( mock1, mock2 )
 
   def test_mock_with_attr_binding(self):
@@ -133,21 +205,22 @@ class ChaiTest(unittest.TestCase):
 
     case = CupOf()
     case.setup()
+    self.addCleanup(case.teardown)
     milk = Milk()
     orig_pour = milk.pour
 
-    self.assertEquals( deque(), case._mocks )
+    self.assertEquals( [], list(case._mocks) )
     mock1 = case.mock( milk, 'pour' )
     self.assertTrue( isinstance(mock1, Mock) )
-    self.assertEquals( deque([(milk,'pour',orig_pour)]), case._mocks )
+    self.assertEquals( [(milk,'pour',orig_pour)], list(case._mocks) )
     mock2 = case.mock( milk, 'pour' )
     self.assertTrue( isinstance(mock2, Mock) )
-    self.assertEquals( deque([(milk,'pour',orig_pour),(milk,'pour',mock1)]), case._mocks )
+    self.assertEquals( [(milk,'pour',orig_pour)], list(case._mocks) )
     self.assertNotEqual( mock1, mock2 )
 
     mock3 = case.mock( milk, 'foo' )
     self.assertTrue( isinstance(mock3, Mock) )
-    self.assertEquals( deque([(milk,'pour',orig_pour),(milk,'pour',mock1),(milk,'foo')]), case._mocks )
+    self.assertEquals( [(milk,'pour',orig_pour),(milk,'foo')], list(case._mocks) )
     
   def test_chai_class_use_metaclass(self):
     obj = CupOf()    
@@ -165,8 +238,10 @@ class ChaiTest(unittest.TestCase):
     # setattr(obj, 'mock2', 'bar')
     
     case = CupOf()
+    case.setup()
+    self.addCleanup(case.teardown)
     stub = Stub()
-    case._stubs = deque([stub])
+    case._stubs.add(stub)
     
     case.test_local_definitions_work_and_are_global()
     self.assertEquals(1, stub.unmet_calls)
@@ -179,5 +254,67 @@ class ChaiTest(unittest.TestCase):
     case = CupOf()
     stub = Stub(milk.pour)
     stub.expect()
-    case._stubs = deque([stub])
+    case._stubs = Registry([stub])
     self.assertRaises(ExpectationNotSatisfied, case.test_something)
+
+  def test_aliases_cached_per_base(self):
+    ChaiTestType._base_cache.pop(CupOf, None)
+    class Sub(CupOf):
+      def test_foo(self): pass
+    self.assertTrue(CupOf in ChaiTestType._base_cache)
+    self.assertEquals(Sub.assertEqual, Sub.assert_equal)
+    self.assertEquals(Sub.assertTrue, Sub.assert_true)
+
+    # Chai already has every alias so subclasses inherit them untouched
+    aliases, tests = ChaiTestType._base_attrs(CupOf)
+    self.assertEquals([], tests)
+    self.assertFalse('assert_equal' in Sub.__dict__)
+
+  def test_subclass_definitions_take_precedence(self):
+    class Base(Chai):
+      def test_foo(self): return 'base'
+      def assert_equal(self, *args): return 'base'
+    class Sub(Base):
+      def test_foo(self): return 'sub'
+      def runTest(self): pass
+
+    self.assertEquals('sub', Sub.test_foo.__wrapped__(None))
+    self.assertEquals('base', Sub().assert_equal(1, 1))
+
+  def test_wraps_tests_from_mixins(self):
+    class Mixin(object):
+      def test_mixed(self): pass
+    class Sub(Mixin, Chai):
+      def runTest(self): pass
+
+    self.assertTrue(Sub.test_mixed._chai_test_wrapper)
+    self.assertEquals(Mixin.test_mixed, Sub.test_mixed.__wrapped__)
+
+  def _module_case(self, **attrs):
+    mod = types.ModuleType('tests.injection_module')
+    sys.modules[mod.__name__] = mod
+    self.addCleanup(sys.modules.pop, mod.__name__)
+    attrs.update({'__module__': mod.__name__, 'runTest': lambda self: None})
+    return mod, type('Case', (Chai,), attrs)
+
+  def test_setup_loads_globals_into_module(self):
+    mod, klass = self._module_case()
+    case = klass()
+    case.setup()
+    self.addCleanup(case.teardown)
+    self.assertEquals(case.stub, mod.stub)
+    self.assertEquals(case.assert_equals, mod.assert_equals)
+    self.assertTrue(mod.is_a is case.is_a)
+    case.teardown()
+    self.assertFalse(hasattr(mod, 'stub'))
+    self.assertTrue(klass in ChaiBase._injection_cache)
+
+  def test_setup_skips_globals_when_disabled(self):
+    mod, klass = self._module_case(inject_globals=False)
+    case = klass()
+    case.setup()
+    self.addCleanup(case.teardown)
+    self.assertFalse(hasattr(mod, 'stub'))
+    self.assertFalse(hasattr(mod, 'assert_equals'))
+    case.teardown()
+    self.assertFalse(klass in ChaiBase._injection_cache)
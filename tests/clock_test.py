@@ -0,0 +1,83 @@
+import time
+import types
+import timeit
+import unittest
+
+from chai import Chai
+from chai.clock import Clock
+from chai.stub import Stub
+
+try:
+  from tests import async_samples
+except (ImportError, SyntaxError):
+  async_samples = None
+
+ORIGINAL_SLEEP = time.sleep
+
+
+class ClockTest(unittest.TestCase):
+
+  def test_clock(self):
+    clock = Clock(start=1000)
+    self.assertEquals(1000, clock.time())
+    self.assertEquals(0, clock.monotonic())
+    clock.sleep(5)
+    clock.advance(0.5)
+    self.assertEquals(1005.5, clock.time())
+    self.assertEquals(5.5, clock.monotonic())
+    self.assertEquals(5.5, clock.perf_counter())
+    self.assertEquals(5500000000, clock.monotonic_ns())
+    self.assertRaises(ValueError, clock.sleep, -1)
+
+  @unittest.skipUnless(hasattr(time, 'monotonic'), "needs time.monotonic")
+  def test_install(self):
+    clock = Clock(start=0)
+    module = types.ModuleType('clock_target')
+    module.sleep = time.sleep
+    stubs = clock.install(modules=[module])
+    try:
+      self.assertTrue(all(isinstance(s, Stub) for s in stubs))
+      start = timeit.default_timer()
+      time.sleep(60)
+      module.sleep(60)
+      self.assertTrue(timeit.default_timer() - start < 1)
+      self.assertEquals(120, time.time())
+      self.assertEquals(120, time.monotonic())
+    finally:
+      for s in stubs:
+        s.teardown()
+    self.assertTrue(time.sleep is ORIGINAL_SLEEP)
+    self.assertTrue(module.sleep is ORIGINAL_SLEEP)
+
+
+class ChaiClockTest(Chai):
+
+  @unittest.skipUnless(hasattr(time, 'perf_counter'), "needs time.perf_counter")
+  def test_clock(self):
+    clock = self.clock(start=100)
+    self.assertTrue(clock is self.clock())
+    time.sleep(3600)
+    self.assertEquals(3700, time.time())
+    self.assertEquals(3600, time.perf_counter())
+    self.assertEquals(3600, clock.monotonic())
+
+  def test_clock_is_torn_down(self):
+    case = ChaiClockTest('test_clock')
+    case.setUp()
+    case.clock()
+    self.assertFalse(time.sleep is ORIGINAL_SLEEP)
+    case.tearDown()
+    self.assertTrue(time.sleep is ORIGINAL_SLEEP)
+
+
+@unittest.skipIf(async_samples is None, "coroutines need python 3.5")
+class ChaiClockLoopTest(Chai):
+  virtual_loop = True
+
+  def test_clock_is_shared_with_the_loop(self):
+    clock = self.clock()
+    self.assertTrue(clock is self.loop.clock)
+    time.sleep(10)
+    self.assertEquals(10, self.loop.time())
+    self.loop.run_until_complete(async_samples.sleep_for(5))
+    self.assertEquals(15, time.monotonic())
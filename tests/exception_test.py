@@ -0,0 +1,50 @@
+import unittest
+
+from chai.exception import *
+
+
+class UnexpectedCallTest(unittest.TestCase):
+
+  def test_message_is_rendered_lazily_and_cached(self):
+    calls = []
+    def suffix():
+      calls.append(1)
+      return 'suffix'
+
+    exc = UnexpectedCall(call='foo', args=(1,), kwargs={'a': 'b'},
+      suffix=suffix)
+    self.assertEquals([], calls)
+
+    msg = str(exc)
+    self.assertTrue('foo' in msg)
+    self.assertTrue("(1, a='b')" in msg)
+    self.assertTrue(msg.endswith('suffix'))
+    self.assertTrue(msg is str(exc))
+    self.assertEquals([1], calls)
+
+  def test_message_with_prefix_and_expected_args(self):
+    exc = UnexpectedCall('msg', prefix='prefix', suffix='suffix', call='foo',
+      args=(1,), expected_args=(2,))
+    msg = str(exc)
+    self.assertTrue(msg.startswith('\n\nprefix'))
+    self.assertTrue('msg' in msg)
+    self.assertTrue('foo(2)' in msg)
+    self.assertTrue(msg.endswith('suffix'))
+
+  def test_captures_exception_being_handled(self):
+    try:
+      try:
+        raise ValueError('handling this')
+      except ValueError:
+        raise UnexpectedCall(call='foo')
+    except UnexpectedCall as e:
+      exc = e
+
+    self.assertTrue('While handling' in str(exc))
+    self.assertTrue('handling this' in str(exc))
+
+  def test_args_and_repr_have_the_message(self):
+    exc = UnexpectedCall('msg', call='foo', args=(1,))
+    self.assertEquals((str(exc),), exc.args)
+    self.assertTrue('foo(1)' in exc.args[0])
+    self.assertEquals('UnexpectedCall(%r)' % str(exc), repr(exc))
@@ -47,6 +47,28 @@ class ArgumentsExpectationRuleTest(unittest.TestCase):
     self.assertFalse(r.validate(age=837))
     self.assertFalse(r.validate(name='vitaly', age=837))
 
+  def test_validate_compiles_plain_values(self):
+    r = ArgumentsExpectationRule(1, 'two', three=3)
+    self.assertEquals(r._test_values, r._test)
+    self.assertTrue(r.validate(1, 'two', three=3))
+    self.assertFalse(r.validate(1, 'two', three=4))
+    self.assertFalse(r.validate(1, 'two', three=3, four=4))
+    self.assertFalse(r.validate(1, three=3))
+
+  def test_validate_compiles_comparators(self):
+    r = ArgumentsExpectationRule(IsA(int), 'two', three=Ignore())
+    self.assertEquals(r._test_comparators, r._test)
+    self.assertTrue(r.validate(1, 'two', three=object()))
+    self.assertFalse(r.validate('1', 'two', three=3))
+    self.assertFalse(r.validate(1, 'two', four=3))
+    self.assertFalse(r.validate(1, 'two', three=3, four=4))
+
+  def test_validate_does_not_modify_arguments(self):
+    r = ArgumentsExpectationRule(a=Ignore())
+    kwargs = {'a': 1}
+    self.assertTrue(r.validate(**kwargs))
+    self.assertEquals({'a': 1}, r.in_kwargs)
+
 class ExpectationRule(unittest.TestCase):
 
   def setUp(self):
@@ -201,6 +223,17 @@ class ExpectationRule(unittest.TestCase):
     exp.test()
     self.assertEquals( ['foo'], called )
 
+  def test_stub_validates_each_call_once(self):
+    calls = []
+    def check(value):
+      calls.append(value)
+      return True
+
+    exp = self.stub.expect().args(Function(check)).returns('ok')
+    self.assertEquals('ok', self.stub('foo'))
+    self.assertEquals(['foo'], calls)
+    self.assertEquals(1, exp._run_count)
+
   def test_closed(self):
     exp = Expectation(self.stub)
     exp.args(1).times(1)
@@ -0,0 +1,148 @@
+import time
+import unittest
+import timeit
+
+from chai.stub import stub
+from chai.exception import UnsupportedModifier
+
+try:
+  import asyncio
+  from chai.loop import VirtualEventLoop
+  from tests import async_samples
+except (ImportError, SyntaxError):
+  async_samples = None
+
+
+@unittest.skipIf(async_samples is None, "coroutines need python 3.5")
+class VirtualEventLoopTest(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = VirtualEventLoop()
+    asyncio.set_event_loop(self.loop)
+
+  def tearDown(self):
+    asyncio.set_event_loop(None)
+    self.loop.close()
+
+  def test_sleep_advances_virtual_time(self):
+    start = timeit.default_timer()
+    self.assertEquals(3600,
+      self.loop.run_until_complete(async_samples.sleep_for(3600)))
+    self.assertEquals(3600, self.loop.time())
+    self.assertTrue(timeit.default_timer() - start < 1)
+
+  def test_wait_for_times_out(self):
+    self.assertEquals('timed out', self.loop.run_until_complete(
+      async_samples.with_timeout(async_samples.sleep_for(60), 30)))
+    self.assertEquals(30, self.loop.time())
+
+  def test_advance(self):
+    fired = []
+    self.loop.call_later(5, fired.append, 1)
+    self.loop.advance(5)
+    self.loop.run_until_complete(async_samples.sleep_for(0))
+    self.assertEquals([1], fired)
+    self.assertRaises(ValueError, self.loop.advance, -1)
+
+  def test_real_io_still_works(self):
+    self.assertEquals('done', self.loop.run_until_complete(
+      self.loop.run_in_executor(None, lambda: 'done')))
+
+  def test_timeouts_on_executor_work_wait_for_it(self):
+    def work():
+      time.sleep(0.05)
+      return 'done'
+    self.assertEquals('done', self.loop.run_until_complete(
+      async_samples.with_timeout(self.loop.run_in_executor(None, work), 5)))
+    self.assertTrue(self.loop.time() < 5)
+    self.assertEquals(0, self.loop._executor_calls)
+
+  def test_idle_sockets_do_not_hold_up_timers(self):
+    import socket
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    listener.setblocking(False)
+    self.loop.add_reader(listener, lambda: None)
+    try:
+      start = timeit.default_timer()
+      self.assertEquals(3600,
+        self.loop.run_until_complete(async_samples.sleep_for(3600)))
+      self.assertTrue(timeit.default_timer() - start < 1)
+    finally:
+      self.loop.remove_reader(listener)
+      listener.close()
+
+  def test_returns_after_on_async_stub(self):
+    client = async_samples.Client()
+    s = stub(client.get)
+    s.expect().returns_after(10, 'late')
+    try:
+      self.assertEquals('late',
+        self.loop.run_until_complete(client.get('a')))
+      self.assertEquals(10, self.loop.time())
+    finally:
+      s.teardown()
+
+  def test_raises_after_and_backoff(self):
+    client = async_samples.Client()
+    s = stub(client.get)
+    s.expect().raises_after(1, IOError).times(3)
+    s.expect().returns('ok')
+    try:
+      result = self.loop.run_until_complete(
+        async_samples.retry(lambda: client.get('a'), 5, 0.5))
+      self.assertEquals('ok', result)
+      # 3 failures take 1s each, and back off for 0.5, 1 and 2 seconds
+      self.assertEquals(6.5, self.loop.time())
+    finally:
+      s.teardown()
+
+  def test_returns_after_on_sync_stub_returns_future(self):
+    class Foo(object):
+      def bar(self): pass
+    foo = Foo()
+    s = stub(foo.bar)
+    s.expect().returns_after(2, 'value')
+    future = foo.bar()
+    self.assertTrue(isinstance(future, asyncio.Future))
+    self.assertEquals('value',
+      self.loop.run_until_complete(async_samples.await_value(future)))
+    self.assertEquals(2, self.loop.time())
+
+  def test_spies_do_not_support_delays(self):
+    class Foo(object):
+      def bar(self): pass
+    spy = stub(Foo().bar).spy()
+    self.assertRaises(UnsupportedModifier, spy.returns_after, 1, 'x')
+    self.assertRaises(UnsupportedModifier, spy.raises_after, 1, IOError)
+
+
+@unittest.skipIf(async_samples is None, "coroutines need python 3.5")
+class ChaiVirtualLoopTest(unittest.TestCase):
+
+  def test_coroutine_tests_run_on_the_virtual_loop(self):
+    case = async_samples.chai_test_case()
+    result = unittest.TestResult()
+    unittest.TestLoader().loadTestsFromTestCase(case).run(result)
+
+    self.assertEquals(3, result.testsRun)
+    self.assertEquals([], result.errors)
+    self.assertEquals(['test_unmet_expectation'],
+      [test._testMethodName for test, _ in result.failures])
+    self.assertEquals(None, case.loop)
+
+  def test_previous_event_loop_is_restored(self):
+    from chai.loop import current_event_loop
+    previous = current_event_loop()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+      case = async_samples.chai_test_case()('test_sleeps_in_virtual_time')
+      result = unittest.TestResult()
+      case.run(result)
+      self.assertTrue(result.wasSuccessful())
+      self.assertTrue(current_event_loop() is loop)
+    finally:
+      asyncio.set_event_loop(previous)
+      loop.close()
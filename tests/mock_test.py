@@ -54,6 +54,34 @@ class MockTest(unittest.TestCase):
     m.foo = 42
     self.assertEquals( 42, m.foo )
 
+  def test_get_attribute_names_are_built_from_the_parent(self):
+    m = Mock()
+    child = m.foo.bar
+    self.assertTrue( child._parent is m.foo )
+    self.assertEquals( 'bar', child._label )
+    self.assertEquals( 'mock.foo.bar', child._name )
+
+    m._name = 'client'
+    self.assertEquals( 'client.foo.bar', child._name )
+    child._name = 'renamed'
+    self.assertEquals( None, child._parent )
+    self.assertEquals( 'renamed', child._name )
+
+  def test_name_in_unexpected_call(self):
+    m = Mock()
+    try:
+      m.query.filter(1)
+    except UnexpectedCall as e:
+      self.assertTrue( 'mock.query.filter' in str(e) )
+    else:
+      self.fail( 'UnexpectedCall not raised' )
+
+  def test_special_methods_are_not_mocked_attributes(self):
+    m = Mock()
+    self.assertRaises( AttributeError, getattr, Mock.__new__(Mock), '_parent' )
+    self.assertRaises( UnexpectedCall, len, m )
+    self.assertFalse( '__len__' in m.__dict__ )
+
   def test_call_raises_unexpectedcall_when_unstubbed(self):
     m = Mock()
     self.assertRaises( UnexpectedCall, m )
@@ -0,0 +1,80 @@
+import os
+import re
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+try:
+  import pytest
+  from chai.pytest_plugin import ChaiFixture
+except ImportError:
+  pytest = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = '''
+import os
+
+def test_met(chai):
+  chai.expect(os, 'getcwd').returns('/there')
+  assert os.getcwd() == '/there'
+
+def test_unmet(chai):
+  chai.expect(os, 'getcwd').returns('/there')
+
+def test_unexpected(chai):
+  chai.expect(os, 'getcwd').args(chai.matches('^x')).returns('/there')
+  os.getcwd('y')
+
+def test_torn_down():
+  assert os.getcwd() != '/there'
+
+def test_comparators(chai):
+  chai.expect(os.path, 'join').args(chai.is_a(str), chai.any_of('a', 'b'))
+  os.path.join('x', 'b')
+
+def test_mock(chai):
+  m = chai.mock()
+  chai.expect(m).returns(3)
+  assert m() == 3
+'''
+
+
+@unittest.skipIf(pytest is None, 'pytest is not installed')
+class PytestPluginTest(unittest.TestCase):
+
+  def test_fixture(self):
+    fixture = ChaiFixture()
+    s = fixture.stub(os, 'getcwd')
+    s.expect().returns('/there')
+    self.assertEquals('/there', os.getcwd())
+    self.assertEquals([], fixture._verify_chai())
+    fixture._teardown_chai()
+    self.assertNotEquals('/there', os.getcwd())
+
+  def test_plugin(self):
+    tmp = tempfile.mkdtemp()
+    try:
+      with open(os.path.join(tmp, 'test_sample.py'), 'w') as f:
+        f.write(SAMPLE)
+      env = dict(os.environ)
+      env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [ROOT, env.get('PYTHONPATH')]))
+      proc = subprocess.Popen(
+        [sys.executable, '-m', 'pytest', '-p', 'no:chai',
+         '-p', 'chai.pytest_plugin', '-p', 'no:cacheprovider',
+         '-rf', 'test_sample.py'],
+        cwd=tmp, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+      output = proc.communicate()[0].decode('utf-8')
+    finally:
+      shutil.rmtree(tmp)
+
+    self.assertTrue(re.search(r'2 failed, 4 passed', output), output)
+    self.assertTrue(
+      'FAILED test_sample.py::test_unmet - chai.exception.'
+      'ExpectationNotSatisfied' in output, output)
+    self.assertTrue(
+      'FAILED test_sample.py::test_unexpected - AssertionError' in output,
+      output)
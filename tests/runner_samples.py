@@ -0,0 +1,35 @@
+"""
+Test classes for the runner to run.
+"""
+import os
+import unittest
+
+from chai import Chai
+from chai.stub import stub
+from chai.comparators import Variable
+
+
+class Counter(object):
+  pass
+
+
+class Met(Chai):
+
+  def test_met(self):
+    self.expect(os, 'getcwd').returns('/there')
+    self.assert_equals('/there', os.getcwd())
+
+  def test_unmet(self):
+    self.expect(os, 'getcwd').returns('/there')
+
+
+class Leaky(unittest.TestCase):
+
+  def test_leaks_stub(self):
+    stub(os, 'getcwd')
+
+  def test_leaks_stub_new(self):
+    stub(Counter)
+
+  def test_leaks_variable(self):
+    Variable('name').test(1)
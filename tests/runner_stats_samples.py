@@ -0,0 +1,20 @@
+"""
+A test class which writes stats, for the runner to run.
+"""
+import os
+
+from chai import Chai
+
+
+class Soak(Chai):
+
+  collect_stats = True
+
+  @property
+  def stats_path(self):
+    return os.environ.get('CHAI_SAMPLE_STATS_PATH')
+
+  def test_soak(self):
+    self.expect(os, 'getcwd').returns('/there').times(2)
+    os.getcwd()
+    os.getcwd()
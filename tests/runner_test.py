@@ -0,0 +1,90 @@
+import io
+import os
+import json
+import glob
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from chai import runner
+from chai.stub import Stub, StubNew
+from chai.comparators import Variable
+
+SAMPLES = 'tests.runner_samples'
+
+
+class RunnerTest(unittest.TestCase):
+
+  def test_discover(self):
+    self.assertEquals(
+      [(SAMPLES, 'Leaky'), (SAMPLES, 'Met')], runner.discover([SAMPLES]))
+
+  def test_find_leaks(self):
+    # Whatever earlier tests left behind
+    runner.find_leaks(stubs=True)
+    self.assertEquals([], runner.find_leaks(stubs=True))
+    Variable('leak').test(1)
+    leaks = runner.find_leaks()
+    self.assertEquals(['Variable._cache holds leak'], leaks)
+    self.assertEquals({}, Variable._cache)
+
+  def test_run(self):
+    report = runner.run(runner.discover([SAMPLES]), processes=1)
+    self.assertFalse(isinstance(os.getcwd, Stub))
+    self.assertEquals(0, len(StubNew._cache))
+
+    self.assertEquals(5, report.tests)
+    self.assertEquals([], report.errors)
+    self.assertEquals(1, len(report.failures))
+    test_id, text = report.failures[0]
+    self.assertEquals(SAMPLES + '.Met.test_unmet', test_id)
+    self.assertTrue('ExpectationNotSatisfied' in text, text)
+    self.assertTrue('os.getcwd' in text, text)
+
+    self.assertEquals([
+      (SAMPLES + '.Leaky.test_leaks_stub_new',
+       'StubNew._cache holds the stub of Counter.__new__'),
+      (SAMPLES + '.Leaky.test_leaks_variable',
+       'Variable._cache holds name'),
+      (SAMPLES + '.Leaky', 'os.getcwd was not torn down'),
+    ], report.leaks)
+    self.assertFalse(report.successful())
+
+    out = io.StringIO() if str is not bytes else io.BytesIO()
+    report.write(out)
+    self.assertTrue(
+      out.getvalue().endswith('FAILED (failures=1, leaks=3)\n'),
+      out.getvalue())
+
+  def test_run_on_pool(self):
+    if multiprocessing.current_process().daemon:
+      self.skipTest('already in a pool')
+    report = runner.run(
+      [(SAMPLES, 'Met'), (SAMPLES, 'Missing')], processes=2)
+    self.assertEquals(2, report.tests)
+    self.assertEquals(1, len(report.failures))
+    self.assertEquals(1, len(report.errors))
+    self.assertEquals(SAMPLES + '.Missing', report.errors[0][0])
+
+  def test_workers_write_stats(self):
+    if multiprocessing.current_process().daemon:
+      self.skipTest('already in a pool')
+    tmp = tempfile.mkdtemp()
+    os.environ['CHAI_SAMPLE_STATS_PATH'] = os.path.join(tmp, 'soak.json')
+    try:
+      report = runner.run(
+        [('tests.runner_stats_samples', 'Soak')], processes=2)
+      self.assertTrue(report.successful())
+      paths = glob.glob(os.path.join(tmp, 'soak.*.json'))
+      self.assertEquals(1, len(paths), paths)
+      with open(paths[0]) as f:
+        reports = json.load(f)
+    finally:
+      del os.environ['CHAI_SAMPLE_STATS_PATH']
+      shutil.rmtree(tmp)
+
+    self.assertEquals(1, len(reports))
+    self.assertEquals(
+      'tests.runner_stats_samples.Soak.test_soak', reports[0]['test'])
+    self.assertEquals(2, reports[0]['stubs'][0]['calls'])
@@ -323,6 +323,27 @@ class SampleBaseTest(Chai):
     with assert_raises(UnsupportedModifier):
         spy(obj.add_to_list).times(0).raises(Exception('oops'))
 
+  def test_spy_records_latency(self):
+    obj = SampleBase()
+    s = spy(obj.add_to_list).times(2)
+    assert_equals(None, s.mean_latency)
+    obj.add_to_list('v1')
+    obj.add_to_list('v2')
+    assert_true(s.max_latency >= s.mean_latency >= 0)
+
+  def test_spy_latency_histogram(self):
+    obj = SampleBase()
+    s = spy(obj.add_to_list).any_order().at_least(0)
+    assert_equals(None, s.percentile(99))
+    for _ in range(98):
+      s._record_latency(0.0001)
+    s._record_latency(0.003)
+    s._record_latency(0.2)
+    assert_equals(100, sum(count for bound, count in s.histogram))
+    assert_true(0.0001 <= s.percentile(50) < 0.00013)
+    assert_true(0.003 <= s.percentile(99) < 0.004)
+    assert_equals(0.2, s.percentile(100))
+
   @unittest.skipIf(IS_PYPY, "can't spy on wrapper-descriptors in PyPy")
   def test_spy_on_method_wrapper(self):
     obj = SampleBase()
@@ -330,6 +351,47 @@ class SampleBaseTest(Chai):
     dict()[obj] = 'hello world'
 
 
+class SpyLatencyLimitTest(unittest.TestCase):
+
+  def run_case(self, limits, spies=1):
+    class Case(Chai):
+      def test_latency(self):
+        obj = SampleBase()
+        for _ in range(spies):
+          s = self.spy(obj.add_to_list)
+          for percentile, ms in limits:
+            s.percentile_under(percentile, ms)
+        for x in range(spies):
+          obj.add_to_list(x)
+        # Record known latencies on the last spy
+        for _ in range(98):
+          s._record_latency(0.0001)
+        s._record_latency(0.003)
+        s._record_latency(0.2)
+
+    result = unittest.TestResult()
+    Case('test_latency').run(result)
+    return result
+
+  def test_limits_met(self):
+    result = self.run_case([(99, 5), (100, 250)])
+    self.assertTrue(result.wasSuccessful(), result.failures)
+
+  def test_limit_exceeded(self):
+    result = self.run_case([(99, 2)])
+    self.assertEquals(1, len(result.failures))
+    text = result.failures[0][1]
+    self.assertTrue('ExpectationNotSatisfied' in text, text)
+    self.assertTrue('p99: ' in text, text)
+    self.assertTrue('Under: 2.000ms' in text, text)
+
+  def test_failures_are_reported_past_compaction(self):
+    # More closed spies than a stub keeps before archiving them
+    result = self.run_case([(100, 0)], spies=300)
+    self.assertEquals(1, len(result.failures))
+    self.assertEquals(300, result.failures[0][1].count('Max: '))
+
+
 class SampleChildTest(Chai):
 
   def test_stub_base_class_expect_child_classmethod(self):
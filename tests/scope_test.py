@@ -0,0 +1,133 @@
+import os
+import threading
+import unittest
+
+from chai import Chai
+from chai.comparators import Variable
+from chai.stub import StubNew
+from chai.scope import Scope, current
+
+
+class Widget(object):
+  pass
+
+
+class ScopeTest(unittest.TestCase):
+
+  def test_enter_and_exit(self):
+    self.assertEquals(None, current())
+    with Scope() as outer:
+      self.assertTrue(current() is outer)
+      with Scope() as inner:
+        self.assertTrue(current() is inner)
+      self.assertTrue(current() is outer)
+    self.assertEquals(None, current())
+
+  def test_released_when_outermost_use_exits(self):
+    scope = Scope()
+    with scope:
+      Variable('foo').test('bar')
+      with scope:
+        self.assertTrue(current() is scope)
+      self.assertEquals({'foo': 'bar'}, scope.variables)
+    self.assertEquals({}, scope.variables)
+    self.assertEquals({}, Variable._cache)
+
+  def test_variables_are_bound_to_the_scope_they_were_created_in(self):
+    with Scope() as scope:
+      var = Variable('foo')
+    var.test('bar')
+    self.assertEquals({'foo': 'bar'}, scope.variables)
+    self.assertFalse('foo' in Variable._cache)
+
+  @unittest.skipUnless(hasattr(threading, 'Barrier'), "needs threading.Barrier")
+  def test_threads_have_their_own_scope(self):
+    results = {}
+    def run(value):
+      with Scope():
+        Variable('foo').test(value)
+        barrier.wait()
+        results[value] = Variable('foo').value
+
+    barrier = threading.Barrier(2)
+    threads = [threading.Thread(target=run, args=(v,)) for v in ('a', 'b')]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEquals({'a': 'a', 'b': 'b'}, results)
+    self.assertEquals({}, Variable._cache)
+
+  def test_stub_new_from_setup_is_torn_down(self):
+    case = ChaiSetUpStubNewTest('test_stub_new_is_shared_with_setup')
+    result = unittest.TestResult()
+    case.run(result)
+    self.assertTrue(result.wasSuccessful(), result.failures + result.errors)
+    self.assertFalse(isinstance(Widget.__dict__.get('__new__'), StubNew))
+    self.assertTrue(isinstance(Widget(), Widget))
+
+  def test_scope_is_released_if_setup_fails(self):
+    class FailedSetUp(Chai):
+      def setUp(self):
+        super(FailedSetUp, self).setUp()
+        self.stub(Widget)
+        self.var('key').test(1)
+        raise RuntimeError('setUp failed')
+
+      def test_never_runs(self):
+        pass
+
+    case = FailedSetUp('test_never_runs')
+    result = unittest.TestResult()
+    previous = current()
+    case.run(result)
+    self.assertEquals(1, len(result.errors))
+    self.assertTrue(current() is previous)
+    self.assertFalse(isinstance(Widget.__dict__.get('__new__'), StubNew))
+    self.assertFalse('key' in Variable._cache)
+
+
+class ChaiScopeTest(Chai):
+
+  def test_variables_are_scoped_to_the_test(self):
+    self.assertTrue(current() is self._scope)
+    self.var('foo').test('bar')
+    self.assertEquals({'foo': 'bar'}, self._scope.variables)
+    self.assertFalse('foo' in Variable._cache)
+
+  def test_scope_is_released_after_the_test(self):
+    case = ChaiScopeTest('test_variables_are_scoped_to_the_test')
+    case.setUp()
+    scope = case._scope
+    case.test_variables_are_scoped_to_the_test()
+    # Still current for tearDown
+    self.assertTrue(current() is scope)
+    self.assertEquals({'foo': 'bar'}, scope.variables)
+    case.tearDown()
+    self.assertEquals({}, scope.variables)
+    self.assertTrue(current() is self._scope)
+
+
+class ChaiSetUpScopeTest(Chai):
+
+  def setUp(self):
+    super(ChaiSetUpScopeTest, self).setUp()
+    self.expect(os, 'getenv').args(self.var('key'))
+
+  def test_variables_are_shared_with_setup(self):
+    self.assertTrue(current() is self._scope)
+    os.getenv('HOME')
+    self.assertEquals('HOME', self.var('key').value)
+    self.assertFalse('key' in Variable._cache)
+
+
+class ChaiSetUpStubNewTest(Chai):
+
+  def setUp(self):
+    super(ChaiSetUpStubNewTest, self).setUp()
+    self.widget_stub = self.stub(Widget)
+
+  def test_stub_new_is_shared_with_setup(self):
+    self.assertTrue(self.stub(Widget) is self.widget_stub)
+    self.assertFalse(Widget in StubNew._cache)
+
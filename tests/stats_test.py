@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+import unittest
+
+from chai import Chai, stats
+from chai.stub import Stub, StubFunction
+from chai.exception import UnexpectedCall
+import tests.samples as samples
+
+
+class StatsTest(unittest.TestCase):
+
+  def test_collect_stats(self):
+    s = Stub('stats')
+    self.assertEquals(None, s.stats())
+    self.assertTrue(s is s.collect_stats())
+    s.expect().args(1).returns(2)
+    s(1)
+    self.assertRaises(UnexpectedCall, s, 3)
+
+    result = s.stats()
+    self.assertEquals(2, result['calls'])
+    self.assertEquals(1, result['matched'])
+    self.assertEquals(1, result['unmatched'])
+    self.assertTrue(result['dispatch_seconds'] > 0)
+    self.assertEquals(0, result['orig_calls'])
+    self.assertEquals(None, result['orig_mean'])
+
+    s.collect_stats(False)
+    self.assertEquals(None, s.stats())
+    s.expect().args(3)
+    s(3)
+    self.assertFalse('_find' in s.__dict__)
+
+  def test_spy_stats(self):
+    s = StubFunction(samples, 'mod_func_3').collect_stats()
+    spy = s.spy().times(2)
+    samples.mod_func_3(1)
+    samples.mod_func_3(2)
+    s.teardown()
+
+    result = spy.stats()
+    self.assertEquals(2, result['calls'])
+    self.assertTrue(result['min'] <= result['mean'] <= result['max'])
+    self.assertEquals(result['min'], spy.min_latency)
+
+    result = s.stats()
+    self.assertEquals('tests.samples.mod_func_3', result['name'])
+    self.assertEquals(2, result['orig_calls'])
+    self.assertEquals(spy._latency_total, result['orig_seconds'])
+    self.assertEquals(spy.max_latency, result['orig_max'])
+
+  def test_formats(self):
+    reports = [{'test': 'a "test"', 'stubs': [{
+      'name': 'f', 'calls': 2, 'matched': 1, 'unmatched': 1,
+      'dispatch_seconds': 0.5, 'orig_calls': 0, 'orig_seconds': 0.0,
+      'orig_min': None, 'orig_mean': None, 'orig_max': None}]}]
+    self.assertEquals(reports, json.loads(stats.to_json(reports)))
+
+    text = stats.to_prometheus(reports)
+    self.assertTrue('# TYPE chai_stub_calls_total counter\n' in text)
+    self.assertTrue(
+      'chai_stub_calls_total{test="a \\"test\\"",stub="f"} 2\n' in text)
+    self.assertFalse('chai_stub_orig_min_seconds{' in text)
+    self.assertRaises(ValueError, stats.dump, reports, 'x', 'xml')
+
+  def test_chai_report(self):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, 'stats.json')
+
+    class Soak(Chai):
+      collect_stats = True
+      stats_path = path
+
+      def test_spy(self):
+        self.spy(samples.mod_func_3)
+        samples.mod_func_3(1)
+
+      def test_nothing(self):
+        pass
+
+    try:
+      for name in ('test_spy', 'test_nothing'):
+        case = Soak(name)
+        case.setUp()
+        getattr(case, name)()
+        case.tearDown()
+      self.assertEquals(None, case.stats_report)
+      stats.flush()
+      with open(stats.process_path(path)) as f:
+        reports = json.load(f)
+    finally:
+      stats._reports.pop((path, 'json'), None)
+      shutil.rmtree(tmp)
+
+    self.assertEquals(1, len(reports))
+    self.assertTrue(reports[0]['test'].endswith('Soak.test_spy'))
+    self.assertEquals(1, reports[0]['stubs'][0]['orig_calls'])
+
+  def test_process_path(self):
+    if multiprocessing.current_process().name != 'MainProcess':
+      self.skipTest('in a child process')
+    worker = os.environ.pop('PYTEST_XDIST_WORKER', None)
+    try:
+      self.assertEquals('soak.json', stats.process_path('soak.json'))
+      os.environ['PYTEST_XDIST_WORKER'] = 'gw3'
+      self.assertEquals('out/soak.gw3.prom', stats.process_path('out/soak.prom'))
+    finally:
+      os.environ.pop('PYTEST_XDIST_WORKER', None)
+      if worker is not None:
+        os.environ['PYTEST_XDIST_WORKER'] = worker
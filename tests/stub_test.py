@@ -1,8 +1,10 @@
 import unittest
 import sys
+import types
 
 from chai.stub import *
 from chai.mock import Mock
+from chai.comparators import IsA, Ignore
 import tests.samples as samples
 
 try:
@@ -72,6 +74,213 @@ class StubTest(unittest.TestCase):
     self.assertTrue(isinstance(res, StubMethod))
     self.assertTrue(isinstance(Foo.prop, StubProperty))
 
+  def test_stub_property_resolves_owner_without_gc(self):
+    import chai.stub as stub_module
+    orig = stub_module.gc
+    class NoGC(object):
+      def get_referrers(self, *objs):
+        raise AssertionError('scanned the heap')
+    stub_module.gc = NoGC()
+    try:
+      # Found through the qualified name of the accessors, even though the
+      # property isn't stored under the name of its getter.
+      prop = samples.SampleBase.set_property
+      res = stub(prop)
+      self.assertTrue(isinstance(res, StubProperty))
+      self.assertEquals('set_property', res._attr)
+      self.assertTrue(samples.SampleBase.__dict__['set_property'] is res)
+      res.teardown()
+      self.assertTrue(samples.SampleBase.__dict__['set_property'] is prop)
+
+      # Local classes are found by walking the class tree
+      class Foo(object):
+        @property
+        def value(self): return 3
+      res = stub(Foo.value)
+      self.assertTrue(isinstance(Foo.__dict__['value'], StubProperty))
+    finally:
+      stub_module.gc = orig
+
+  def test_stub_property_registry_checks_the_owner(self):
+    import chai.stub as stub_module
+    class Foo(object):
+      @property
+      def value(self): return 3
+    prop = Foo.value
+    self.assertEquals((Foo, 'value'), stub_module._property_owner(prop))
+    self.assertEquals((Foo, 'value'), stub_module._owner_from_registry(prop))
+
+    class Bar(object):
+      pass
+    Bar.other = prop
+    del Foo.value
+    self.assertEquals(None, stub_module._owner_from_registry(prop))
+    self.assertEquals((Bar, 'other'), stub_module._property_owner(prop))
+
+  def test_stub_several_attributes(self):
+    class Foo(object):
+      def bar(self): pass
+      @property
+      def prop(self): return 3
+      @classmethod
+      def cmethod(cls): pass
+
+    foo = Foo()
+    res = stub(foo, 'bar', 'prop', 'cmethod')
+    self.assertTrue(isinstance(res, tuple))
+    self.assertTrue(isinstance(res[0], StubMethod))
+    self.assertTrue(isinstance(res[1], StubProperty))
+    self.assertTrue(isinstance(res[2], StubMethod))
+    self.assertEquals(res, stub(foo, 'bar', 'prop', 'cmethod'))
+    self.assertRaises(UnsupportedStub, stub, foo, 'bar', '__class__')
+
+  def test_stub_all(self):
+    class Client(object):
+      def get(self): pass
+      def get_all(self): pass
+      def put(self): pass
+      def _send(self): pass
+      @property
+      def prop(self): return 3
+      value = 5
+
+    client = Client()
+    group = stub_all(client)
+    self.assertTrue(isinstance(group, StubGroup))
+    self.assertEquals(['get', 'get_all', 'put'], list(group.stubs))
+    self.assertTrue(group['get'] is client.get)
+    self.assertEquals(5, client.value)
+    self.assertFalse(isinstance(client._send, Stub))
+
+    group['get'].expect().returns(1)
+    self.assertEquals(1, client.get())
+    group['put'].expect()
+    self.assertEquals(1, len(group.unmet_expectations()))
+    group.teardown()
+    self.assertFalse(isinstance(client.get, Stub))
+    self.assertFalse(isinstance(client.put, Stub))
+
+    group = stub_all(client, include=['get*', '_*'], exclude='*_all')
+    self.assertEquals(['_send', 'get'], list(group.stubs))
+    group.teardown()
+
+  def test_stub_all_does_not_read_properties(self):
+    class Client(object):
+      reads = 0
+      def get(self): pass
+      @staticmethod
+      def build(): pass
+      @classmethod
+      def create(cls): pass
+      @property
+      def broken(self):
+        raise RuntimeError('read')
+      @property
+      def counted(self):
+        Client.reads += 1
+        return self.get
+
+    client = Client()
+    group = stub_all(client)
+    try:
+      self.assertEquals(['create', 'get'], sorted(group.stubs))
+      self.assertEquals(0, Client.reads)
+    finally:
+      group.teardown()
+
+  def test_stub_all_module(self):
+    group = stub_all(samples, include='mod_func_*')
+    self.assertEquals(4, len(group))
+    self.assertTrue(isinstance(samples.mod_func_1, StubFunction))
+    self.assertTrue('mod_func_4' in group)
+    group.teardown()
+    self.assertFalse(isinstance(samples.mod_func_1, Stub))
+
+  @unittest.skipIf(not hasattr(__import__('inspect'), 'signature'),
+                   'needs inspect.signature')
+  def test_autospec(self):
+    import chai.stub as stub_module
+    def func(a, b=2, *args, **kwargs): pass
+
+    s = StubFunction(func)
+    self.assertTrue(s is s.autospec())
+    self.assertTrue(func in stub_module._signatures)
+    s.expect().args(1, b=2).returns('both').times(3)
+    self.assertEquals('both', s(1, 2))
+    self.assertEquals('both', s(1))
+    self.assertEquals('both', s(a=1, b=2))
+    self.assertRaises(UnexpectedCall, s, 1, 3)
+    self.assertRaises(TypeError, s, b=3)
+
+    s.expect().args(IsA(int), Ignore(), 5, c=6).returns('rest')
+    self.assertEquals('rest', s(1, 'any', 5, c=6))
+    self.assertRaises(TypeError, s.expect().args, b=3)
+
+  @unittest.skipIf(not hasattr(__import__('inspect'), 'signature'),
+                   'needs inspect.signature')
+  def test_autospec_methods(self):
+    class Foo(object):
+      def bar(self, a, b=None): pass
+      @staticmethod
+      def static(a): pass
+      def __init__(self, a, b=None): pass
+
+    foo = object.__new__(Foo)
+    s = StubMethod(foo.bar)
+    s.expect().args(1)
+    s.autospec()
+    s.expect().args(2, b=3)
+    s(a=1)
+    s(2, 3)
+    self.assertEquals([], s.unmet_expectations())
+    s.teardown()
+
+    s = StubUnboundMethod(Foo, 'bar').autospec()
+    s.expect().args(1, None)
+    Foo.bar(b=None, a=1)
+    s.teardown()
+
+    s = StubUnboundMethod(Foo, 'static').autospec()
+    self.assertRaises(TypeError, s.expect().args, 1, 2)
+    s.teardown()
+
+    class Bar(object):
+      @staticmethod
+      def static(a, b=2): pass
+
+    s = StubUnboundMethod(Bar, 'static').autospec()
+    s.expect().args(1).returns('static')
+    self.assertEquals('static', Bar.static(1, b=2))
+    s.teardown()
+
+    s = stub(Foo).autospec()
+    s.expect().args(a=1).returns('new')
+    self.assertEquals('new', Foo(1))
+    s.teardown()
+
+    s = StubProperty(Foo, 'bar')
+    self.assertRaises(UnsupportedModifier, s.autospec)
+    s.teardown()
+
+  def test_stub_factories_are_cached_per_category(self):
+    import chai.stub as stub_module
+    class Foo(object):
+      def bar(self): pass
+
+    # An unbound method in python 2, a function in python 3
+    method_type = type(Foo.bar)
+    self.assertTrue(isinstance(stub(Foo, 'bar'), StubUnboundMethod))
+    Foo.bar.teardown()
+    self.assertTrue(isinstance(stub(samples, 'mod_func_1'), StubFunction))
+    samples.mod_func_1.teardown()
+    factories = stub_module._attr_factories
+    self.assertTrue('class' in factories[method_type])
+    self.assertTrue('module' in factories[types.FunctionType])
+
+    # The cached factory is used on the next stub
+    self.assertTrue(isinstance(stub(Foo, 'bar'), StubUnboundMethod))
+    Foo.bar.teardown()
+
   def test_stub_mock_with_attr_name(self):
     class Foo(object):
       def bar(self): pass
@@ -221,6 +430,17 @@ class StubClassTest(unittest.TestCase):
     self.assertEquals('attr', s._attr)
     self.assertEquals([], s._expectations)
 
+  def test_describe(self):
+    s = StubFunction(samples, 'mod_func_1')
+    s.teardown()
+    self.assertEquals('tests.samples.mod_func_1', s.describe())
+
+    class Unnamed(Stub):
+      @property
+      def name(self):
+        raise AttributeError('name')
+    self.assertEquals("Unnamed on 'obj'", Unnamed('obj').describe())
+
   def test_unment_expectations(self):
     s = Stub('obj', 'attr')
     s.expect().args(123).returns(1)
@@ -255,7 +475,7 @@ class StubClassTest(unittest.TestCase):
     class Expect(object):
       def closed(self): return False
       def match(self, *args, **kwargs): return True
-      def test(self, *args, **kwargs): return 'success'
+      def _test(self, matched, args, kwargs): return 'success'
 
     s = Stub('obj')
     s._expectations = [ Expect() ]
@@ -296,6 +516,188 @@ class StubClassTest(unittest.TestCase):
     self.assertEquals(0, s._expectations[0]._close_count)
     self.assertEquals(0, s._expectations[1]._close_count)
 
+  def test_call_dispatches_any_order_expectations_by_hash(self):
+    s = Stub('obj')
+    for x in range(100):
+      s.expect().args(x, key=str(x)).returns(x * 2).any_order()
+
+    self.assertEquals(198, s(99, key='99'))
+    self.assertEquals(0, s(0, key='0'))
+    self.assertEquals(100, len(s._index))
+    self.assertEquals(0, len(s._scan))
+
+    # Closed expectations are dropped from the index as they're found
+    self.assertRaises(UnexpectedCall, s, 0, key='0')
+    self.assertEquals(99, len(s._index))
+
+  def test_call_falls_back_to_scan_for_unhashable_comparators(self):
+    s = Stub('obj')
+    s.expect().args([1, 2]).returns('list').any_order()
+    s.expect().args(IsA(int)).returns('int').any_order()
+    s.expect().args('a').returns('a').any_order()
+
+    self.assertEquals('a', s('a'))
+    self.assertEquals('int', s(5))
+    self.assertEquals('list', s([1, 2]))
+    self.assertEquals(1, len(s._index))
+    self.assertEquals(2, len(s._scan))
+
+  def test_call_respects_order_with_indexed_expectations(self):
+    s = Stub('obj')
+    s.expect().args('first').returns(1)
+    s.expect().args('any').returns(2).any_order()
+
+    self.assertRaises(UnexpectedCall, s, 'any')
+    self.assertEquals(1, s('first'))
+    self.assertEquals(2, s('any'))
+
+  def test_call_prefers_earlier_scanned_expectation(self):
+    s = Stub('obj')
+    s.expect().args(Ignore()).returns('ignore').any_order()
+    s.expect().args('a').returns('a').any_order()
+
+    self.assertEquals('ignore', s('a'))
+
+  def test_call_reindexes_expectation_changed_after_use(self):
+    s = Stub('obj')
+    exp = s.expect().args('a').returns('a').any_order()
+    self.assertEquals('a', s('a'))
+    exp.args('b')
+    self.assertRaises(UnexpectedCall, s, 'a')
+    self.assertEquals('a', s('b'))
+
+  def test_pending_expectations_do_not_reindex(self):
+    s = Stub('obj')
+    s.expect().args('a').returns('a').any_order()
+    self.assertEquals('a', s('a'))
+    filed = s._classified
+    s.returns_map({'b': 'b', 'c': 'c'})
+    self.assertEquals(filed, s._classified)
+    self.assertEquals('c', s('c'))
+
+  def test_returns_map(self):
+    s = Stub('obj')
+    exps = s.returns_map({'a': 1, 'b': 2})
+
+    self.assertEquals(1, s('a'))
+    self.assertEquals(1, s('a'))
+    self.assertEquals(2, s('b'))
+    self.assertEquals(2, exps['a']._run_count)
+    self.assertEquals(1, exps['b']._run_count)
+    self.assertRaises(UnexpectedCall, s, 'c')
+    self.assertEquals([], s.unmet_expectations())
+
+  def test_returns_map_counts_can_be_tightened(self):
+    s = Stub('obj')
+    s.returns_map({'a': 1, 'b': 2})['b'].times(1)
+
+    self.assertEquals(1, len(s.unmet_expectations()))
+    self.assertEquals(2, s('b'))
+    self.assertEquals([], s.unmet_expectations())
+    self.assertRaises(UnexpectedCall, s, 'b')
+
+  def test_call_archives_closed_ordered_expectations(self):
+    s = Stub('obj')
+    s._compact_after = 10
+    for x in range(100):
+      s.expect().args(x).returns(x)
+    exp = s.expect().args('last').times(2)
+
+    for x in range(100):
+      self.assertEquals(x, s(x))
+    s('last')
+
+    self.assertTrue(len(s._expectations) < 100)
+    self.assertEquals(exp, s._expectations[-1])
+    self.assertEquals(1, len(s.unmet_expectations()))
+    self.assertTrue('archived, Ran:' in s._format_exception())
+
+    s('last')
+    self.assertEquals([], s.unmet_expectations())
+    self.assertRaises(UnexpectedCall, s, 'last')
+
+  def test_thread_safe_counts_every_call(self):
+    import threading
+    s = Stub('obj')
+    self.assertTrue(s is s.thread_safe())
+    exp = s.expect().args(1).returns(2).times(800)
+
+    def worker():
+      for _ in range(100):
+        s(1)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEquals(800, exp._run_count)
+    self.assertEquals([], s.unmet_expectations())
+    self.assertRaises(UnexpectedCall, s, 1)
+
+  def test_thread_safe_runs_side_effects_outside_the_lock(self):
+    import threading
+    s = Stub('obj').thread_safe()
+    finished = []
+    def side_effect(value):
+      if value == 'outer':
+        thread = threading.Thread(target=lambda: finished.append(s('inner')))
+        thread.start()
+        thread.join(5)
+    s.expect().any_args().returns('result').side_effect(side_effect).times(2)
+
+    self.assertEquals('result', s('outer'))
+    self.assertEquals(['result'], finished)
+
+  def test_record_calls(self):
+    s = Stub('obj')
+    self.assertTrue(s is s.record_calls(capacity=3))
+    exp = s.expect().args(1).any_order().at_least(0)
+
+    for _ in range(4):
+      s(1)
+    try:
+      s(2, x='y')
+    except UnexpectedCall as e:
+      exc = e
+
+    calls = s.recorded_calls
+    self.assertEquals(3, len(calls))
+    self.assertEquals([exp, exp, None], [c.expectation for c in calls])
+    self.assertEquals(((2,), {'x': 'y'}), (calls[-1].args, calls[-1].kwargs))
+    self.assertTrue(calls[0].timestamp <= calls[-1].timestamp)
+    self.assertTrue(calls[0].thread is not None)
+
+    self.assertEquals(calls, exc.history)
+    self.assertTrue('Recent calls' in str(exc))
+    self.assertTrue("(2, x='y') [thread %s] unexpected" % calls[-1].thread
+      in str(exc))
+
+  def test_record_calls_summarized(self):
+    s = Stub('obj')
+    s.record_calls(summarize=True)
+    s.expect().any_args()
+    value = 'x' * 100
+    s(value, key=[1, 2])
+
+    record = s.recorded_calls[0]
+    self.assertTrue(len(record.args[0]) < 50)
+    self.assertEquals('[1, 2]', repr(record.kwargs['key']))
+
+  def test_record_calls_can_be_stopped(self):
+    s = Stub('obj')
+    s.expect().any_args().at_least(0)
+    s(1)
+    self.assertEquals([], s.recorded_calls)
+
+    s.record_calls()
+    s(1)
+    self.assertEquals(1, len(s.recorded_calls))
+    s.record_calls(0)
+    s(1)
+    self.assertEquals([], s.recorded_calls)
+
+
 class StubPropertyTest(unittest.TestCase):
   # FIXME: Need to test teardown and init, these test might be in the base stub tests.
 
@@ -445,13 +847,53 @@ class StubNewTest(unittest.TestCase):
     class Expect(object):
       def closed(self): return False
       def match(self, *args, **kwargs): return args==('state',) and kwargs=={'a':'b'}
-      def test(self, *args, **kwargs): return 'success'
+      def _test(self, matched, args, kwargs): return 'success'
 
     s = StubNew(Foo)
     s._expectations = [ Expect() ]
     self.assertEquals('success', Foo('state', a='b'))
     s.teardown()
 
+  def test_registry_does_not_keep_classes_alive(self):
+    import gc
+    import weakref
+    class Foo(object): pass
+
+    s = StubNew(Foo)
+    self.assertTrue(s is StubNew(Foo))
+    ref = weakref.ref(Foo)
+    del Foo, s
+    gc.collect()
+    self.assertEquals(None, ref())
+
+  def test_stub_in_place_is_reused_in_a_scope(self):
+    from chai.scope import Scope
+    class Foo(object): pass
+
+    s = StubNew(Foo)
+    try:
+      with Scope():
+        self.assertTrue(s is StubNew(Foo))
+    finally:
+      s.teardown()
+      StubNew._cache.clear()
+    self.assertTrue(isinstance(Foo(), Foo))
+
+  def test_registry_is_per_scope(self):
+    from chai.scope import Scope
+    class Foo(object): pass
+
+    with Scope() as scope:
+      s = StubNew(Foo)
+      self.assertTrue(s is StubNew(Foo))
+      self.assertTrue(Foo in scope.stub_news)
+      self.assertFalse(Foo in StubNew._cache)
+
+    # Left over stubs are torn down when the scope is released
+    self.assertTrue(s._torn)
+    self.assertEquals(0, len(scope.stub_news))
+    self.assertTrue(isinstance(Foo(), Foo))
+
   @unittest.skipIf(sys.version_info.major==3, "can't stub unbound methods in python 3")
   def test_call_orig(self):
     class Foo(object):